@@ -0,0 +1,102 @@
+"""Benchmark of cubit.cut_part: the time spent per source part has to stay flat while the
+result collection fills up. The cubit engines, with and without the classification of the cells, are then
+checked against each other: they must give the same number of parts with the same total volume.
+
+Run with:
+blender --background --factory-startup --python-exit-code 1 --python benchmarks/bench_cut_part.py -- [source parts]
+"""
+import bpy
+import sys
+import os
+import time
+
+# Add the add-on and benchmark directories to the Python path
+benchmarks_dir = os.path.dirname(os.path.realpath(__file__))
+addon_dir = os.path.dirname(benchmarks_dir)
+for path in (addon_dir, benchmarks_dir):
+    if path not in sys.path:
+        sys.path.append(path)
+
+import cubit
+import mesh_utils
+import synthetic
+
+CUT_SIZE = 2.0
+# Cut size of the engine comparison, for the synthetic shapes sized in centimeters
+COMPARE_CUT_SIZE = 20.0
+# The cubes of the Boolean engine are RELATIVE_OFFSET apart, the thin gaps between them hold no volume
+VOLUME_TOLERANCE = 0.01
+# engine name: keyword arguments of cubit.cubit, the first one is the reference
+ENGINES = {
+    "boolean unclassified": {"engine": 'BOOLEAN', "classify": False},
+    "boolean": {"engine": 'BOOLEAN'},
+    "boolean batched": {"engine": 'BOOLEAN', "batched": True},
+    "slice": {"engine": 'SLICE'},
+}
+
+
+def make_sources(count, collection):
+    """Add a row of icospheres, each one cut into several slabs along x."""
+    for i in range(count):
+        bpy.ops.mesh.primitive_ico_sphere_add(subdivisions=3, radius=4, location=(i * 10, 0, 0))
+        source = bpy.context.active_object
+        collection.objects.link(source)
+        bpy.context.collection.objects.unlink(source)
+
+
+def main(count):
+    sources_collection = cubit.create_collection("Sources")
+    parts_collection = cubit.create_collection("Parts")
+    make_sources(count, sources_collection)
+
+    timings = []
+    for source in list(sources_collection.objects):
+        start = time.perf_counter()
+        cubit.cut_part(source, "x", CUT_SIZE, parts_collection)
+        timings.append(time.perf_counter() - start)
+
+    quarter = max(len(timings) // 4, 1)
+    first = sum(timings[:quarter]) / quarter
+    last = sum(timings[-quarter:]) / quarter
+    print(f"{count} source parts cut into {len(parts_collection.objects)} parts")
+    print(f"first quarter: {first * 1000:.1f} ms per source part")
+    print(f"last quarter:  {last * 1000:.1f} ms per source part ({last / first:.2f}x)")
+
+
+def part_stats(parts):
+    """Return the number of parts and their total volume."""
+    volume = 0.0
+    for part in parts:
+        bm = mesh_utils.object_to_bmesh(part)
+        volume += bm.calc_volume()
+        bm.free()
+    return len(parts), volume
+
+
+def compare_engines(shape):
+    """Cut the same shape with every engine and return whether they all match the first one."""
+    source = synthetic.make_mesh_object(shape, "small")
+    stats = {}
+    for name, options in ENGINES.items():
+        obj = mesh_utils.duplicate_object(source, f"{shape} {name}")
+        parts = cubit.cubit(obj, COMPARE_CUT_SIZE, **options)
+        stats[name] = part_stats(parts)
+        for collection in {collection for part in parts for collection in part.users_collection}:
+            cubit.delete_collection(collection)
+        mesh_utils.remove_object(obj)
+    mesh_utils.remove_object(source)
+
+    reference_count, reference_volume = next(iter(stats.values()))
+    matching = True
+    for name, (count, volume) in stats.items():
+        ok = count == reference_count and abs(volume - reference_volume) <= VOLUME_TOLERANCE * reference_volume
+        matching = matching and ok
+        print(f"{shape} {name}: {count} parts, volume {volume:.1f}{'' if ok else '  MISMATCH'}")
+    return matching
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    main(int(argv[0]) if argv else 40)
+    if not all([compare_engines(shape) for shape in synthetic.SHAPES]):
+        sys.exit("The cubit engines do not agree")
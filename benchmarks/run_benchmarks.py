@@ -0,0 +1,240 @@
+"""Benchmark suite of the cutting, hollowing and export pipeline.
+
+Run all the cases. Each one is set up and saved by a Blender process and timed in another, so the peak memory is
+that of the case alone:
+blender --background --factory-startup --python benchmarks/run_benchmarks.py -- --output results.json
+
+Run a subset with --cases, --shapes and --sizes (comma separated), see CASES, synthetic.SHAPES and
+synthetic.SIZES. Compare two result files to catch regressions before a rollout.
+"""
+import bpy
+import argparse
+import ctypes
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Add the add-on and benchmark directories to the Python path
+benchmarks_dir = os.path.dirname(os.path.realpath(__file__))
+addon_dir = os.path.dirname(benchmarks_dir)
+for path in (addon_dir, benchmarks_dir):
+    if path not in sys.path:
+        sys.path.append(path)
+
+import synthetic
+
+try:
+    import resource
+except ImportError:
+    # Windows, see peak_rss_mb
+    resource = None
+
+CUT_SIZE = 20.0
+SHELL_THICKNESS = 3.0
+
+
+def set_selected_object(obj):
+    # Assigned as an ID property to skip the update callback, which needs a 3D viewport
+    bpy.context.scene.mesh_selector_tool["selected_object"] = obj
+
+
+def run_cubit(obj, engine):
+    import cubit
+    cubit.cubit(obj, CUT_SIZE, engine, build_volume=(CUT_SIZE, CUT_SIZE, CUT_SIZE), batched=True)
+
+
+def setup_chopit(obj):
+    """Put a thin slab across the middle of the object in the "Cutting objects" collection."""
+    import mesh_utils
+    collection = bpy.data.collections.new("Cutting objects")
+    bpy.context.scene.collection.children.link(collection)
+    low, high = mesh_utils.world_bounds(obj)
+    middle = (low.z + high.z) / 2
+    cutter_low = (low.x - 1, low.y - 1, middle - 0.25)
+    cutter_high = (high.x + 1, high.y + 1, middle + 0.25)
+    mesh_utils.new_mesh_object("Cut Mesh", mesh_utils.box_vertices(cutter_low, cutter_high), mesh_utils.BOX_FACES, collection)
+    set_selected_object(obj)
+
+
+def run_chopit(obj):
+    if bpy.ops.object.chopit() != {'FINISHED'}:
+        raise RuntimeError("Chop it failed")
+
+
+def run_make_hollow(obj, engine='MESH'):
+    import make_hollow
+    make_hollow.make_hollow_part(obj, SHELL_THICKNESS, engine)
+
+
+def setup_export(obj):
+    """Cut the object into parts and point the exporter to a temporary folder."""
+    import cubit
+    cubit.cubit(obj, CUT_SIZE, 'SLICE')
+    bpy.context.scene.folder_selector_tool.export_folder = tempfile.mkdtemp(prefix="chopchop_export_")
+
+
+def run_export(obj):
+    bpy.ops.object.export_all_meshes()
+
+
+# name: (setup, timed run)
+CASES = {
+    "cubit_boolean": (None, lambda obj: run_cubit(obj, 'BOOLEAN')),
+    "cubit_slice": (None, lambda obj: run_cubit(obj, 'SLICE')),
+    "cubit_fit": (None, lambda obj: run_cubit(obj, 'FIT')),
+    "chopit": (setup_chopit, run_chopit),
+    "make_hollow": (None, run_make_hollow),
+    "make_hollow_voxel": (None, lambda obj: run_make_hollow(obj, 'VOXEL')),
+    "export": (setup_export, run_export),
+}
+
+
+class ProcessMemoryCounters(ctypes.Structure):
+    """PROCESS_MEMORY_COUNTERS of the Windows process status API."""
+    _fields_ = [
+        ("cb", ctypes.c_uint32),
+        ("PageFaultCount", ctypes.c_uint32),
+        ("PeakWorkingSetSize", ctypes.c_size_t),
+        ("WorkingSetSize", ctypes.c_size_t),
+        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+        ("PagefileUsage", ctypes.c_size_t),
+        ("PeakPagefileUsage", ctypes.c_size_t),
+    ]
+
+
+def peak_rss_mb():
+    if resource is None:
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        get_current_process = ctypes.windll.kernel32.GetCurrentProcess
+        get_current_process.restype = ctypes.c_void_p
+        get_memory_info = ctypes.windll.psapi.GetProcessMemoryInfo
+        get_memory_info.argtypes = [ctypes.c_void_p, ctypes.POINTER(ProcessMemoryCounters), ctypes.c_uint32]
+        get_memory_info(get_current_process(), ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize / (1024 * 1024)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def scene_stats():
+    """Return the number of visible mesh objects and their triangles."""
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    parts = [obj for obj in bpy.context.view_layer.objects if obj.type == 'MESH' and obj.visible_get()]
+    triangles = 0
+    for obj in parts:
+        mesh = obj.evaluated_get(depsgraph).data
+        mesh.calc_loop_triangles()
+        triangles += len(mesh.loop_triangles)
+    return len(parts), triangles
+
+
+def prepare_case(case, shape, size, blend_path):
+    """Make the object of a case, run the setup of the case and save the scene to blend_path, in a process of its own
+    so the memory the setup used does not count in the peak of the case."""
+    import operators
+    operators.register()
+    for obj in list(bpy.data.objects):
+        bpy.data.objects.remove(obj)
+
+    obj = synthetic.make_mesh_object(shape, size)
+    scene = bpy.context.scene
+    scene["bench_object"] = obj.name
+    scene["bench_shape"], scene["bench_size"] = shape, size
+    scene["bench_source_triangles"] = scene_stats()[1]
+    setup = CASES[case][0]
+    if setup:
+        setup(obj)
+    bpy.ops.wm.save_as_mainfile(filepath=blend_path)
+
+
+def run_case(case, blend_path):
+    """Run one case in this Blender process on the scene prepare_case saved, and return its result."""
+    import operators
+    operators.register()
+    bpy.ops.wm.open_mainfile(filepath=blend_path, load_ui=False)
+    scene = bpy.context.scene
+    obj = bpy.data.objects[scene["bench_object"]]
+    source_triangles = scene["bench_source_triangles"]
+    shape, size = scene["bench_shape"], scene["bench_size"]
+    run = CASES[case][1]
+
+    start = time.perf_counter()
+    run(obj)
+    wall_time = time.perf_counter() - start
+
+    parts, triangles = scene_stats()
+    return {
+        "case": case,
+        "shape": shape,
+        "size": size,
+        "source_triangles": source_triangles,
+        "wall_time": wall_time,
+        "peak_rss_mb": peak_rss_mb(),
+        "parts": parts,
+        "triangles": triangles,
+    }
+
+
+def run_isolated(case, shape, size):
+    """Prepare one case in a new background Blender process, then run it in another one, and return its result."""
+    with tempfile.TemporaryDirectory(prefix="chopchop_bench_") as folder:
+        blend_path = os.path.join(folder, "case.blend")
+        result_path = os.path.join(folder, "result.json")
+        for step in (["--prepare", blend_path], ["--blend", blend_path]):
+            command = [
+                bpy.app.binary_path, "--background", "--factory-startup", "--python-exit-code", "1",
+                "--python", os.path.realpath(__file__), "--",
+                "--case", case, "--shapes", shape, "--sizes", size, "--output", result_path, *step,
+            ]
+            completed = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            if completed.returncode != 0:
+                return {"case": case, "shape": shape, "size": size, "error": completed.stderr.strip().splitlines()[-1:]}
+        with open(result_path) as result_file:
+            return json.load(result_file)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="ChopChop benchmark suite")
+    parser.add_argument("--cases", default=",".join(CASES))
+    parser.add_argument("--shapes", default=",".join(synthetic.SHAPES))
+    parser.add_argument("--sizes", default=",".join(synthetic.SIZES))
+    parser.add_argument("--output", default="bench_output.json")
+    # Internal: prepare or run a single case in this process
+    parser.add_argument("--case")
+    parser.add_argument("--prepare")
+    parser.add_argument("--blend")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.prepare:
+        prepare_case(args.case, args.shapes, args.sizes, args.prepare)
+        return
+    if args.case:
+        result = run_case(args.case, args.blend)
+        with open(args.output, "w") as output_file:
+            json.dump(result, output_file)
+        return
+
+    results = []
+    for case in args.cases.split(","):
+        for shape in args.shapes.split(","):
+            for size in args.sizes.split(","):
+                result = run_isolated(case, shape, size)
+                print(json.dumps(result))
+                results.append(result)
+
+    with open(args.output, "w") as output_file:
+        json.dump({"blender": bpy.app.version_string, "results": results}, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
@@ -0,0 +1,66 @@
+"""Synthetic test meshes for the benchmarks, sized in centimeters like the scans ChopChop works on."""
+import bpy
+import bmesh
+import math
+from mathutils import Vector, noise
+
+# Icosphere subdivisions for each benchmark size, the torus and blob are built to a similar triangle count
+SIZES = {"small": 5, "medium": 6, "large": 7}
+RADIUS = 50.0
+
+
+def icosphere_bmesh(subdivisions):
+    bm = bmesh.new()
+    bmesh.ops.create_icosphere(bm, subdivisions=subdivisions, radius=RADIUS)
+    return bm
+
+
+def torus_bmesh(subdivisions):
+    """A torus with about as many triangles as the icosphere of the same subdivisions."""
+    triangles = 20 * 4 ** subdivisions
+    minor_segments = int(math.sqrt(triangles / 8))
+    major_segments = 4 * minor_segments
+    bm = bmesh.new()
+    rings = []
+    for i in range(major_segments):
+        angle = 2 * math.pi * i / major_segments
+        center = Vector((math.cos(angle), math.sin(angle), 0)) * RADIUS * 0.7
+        ring = []
+        for j in range(minor_segments):
+            minor_angle = 2 * math.pi * j / minor_segments
+            offset = Vector((math.cos(angle) * math.cos(minor_angle), math.sin(angle) * math.cos(minor_angle), math.sin(minor_angle)))
+            ring.append(bm.verts.new(center + offset * RADIUS * 0.3))
+        rings.append(ring)
+    for i in range(major_segments):
+        ring, next_ring = rings[i], rings[(i + 1) % major_segments]
+        for j in range(minor_segments):
+            k = (j + 1) % minor_segments
+            bm.faces.new((ring[j], next_ring[j], next_ring[k], ring[k]))
+    bmesh.ops.triangulate(bm, faces=bm.faces)
+    bmesh.ops.recalc_face_normals(bm, faces=bm.faces)
+    return bm
+
+
+def blob_bmesh(subdivisions):
+    """An icosphere displaced along its normals by a noise field, like a rough scan."""
+    bm = icosphere_bmesh(subdivisions)
+    bm.normal_update()
+    for vert in bm.verts:
+        vert.co += vert.normal * noise.noise(vert.co / 15) * RADIUS * 0.3
+    return bm
+
+
+SHAPES = {"icosphere": icosphere_bmesh, "torus": torus_bmesh, "blob": blob_bmesh}
+
+
+def make_mesh_object(shape, size, collection=None):
+    """Build one of the SHAPES at one of the SIZES and link it, resting on the ground, to the collection."""
+    bm = SHAPES[shape](SIZES[size])
+    lowest_point = min(vert.co.z for vert in bm.verts)
+    bmesh.ops.translate(bm, verts=bm.verts, vec=(0, 0, -lowest_point))
+    mesh = bpy.data.meshes.new(f"{shape}_{size}")
+    bm.to_mesh(mesh)
+    bm.free()
+    obj = bpy.data.objects.new(mesh.name, mesh)
+    (collection or bpy.context.scene.collection).objects.link(obj)
+    return obj
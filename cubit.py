@@ -1,187 +1,424 @@
 import bpy
+import bmesh
+import math
+import numpy as np
+from bisect import bisect_left
 from mathutils import Vector
+from mathutils.bvhtree import BVHTree
+import jobs
+import mesh_utils
+import profiling
+import spatial_index
 
 # Constants
 RELATIVE_OFFSET = -1.001
+SLICE_EPSILON = 1e-5
+# The cells are shrunk by this fraction of the cut size before being classified, so the faces of the part lying
+# on its own bounding box do not count as crossing the cell
+CELL_MARGIN = 1e-4
+AXIS_INDEX = {'x': 0, 'y': 1, 'z': 2}
+MAX_FIT_ROUNDS = 64
 
 def get_part_center(part):
-
-    # Deselect all, select and make active the part
-    bpy.ops.object.select_all(action='DESELECT')
-    part.select_set(True)
-    bpy.context.view_layer.objects.active = part
-
-    # Get the world-space coordinates of the bounding box vertices
-    bounding_box_world_coords = [part.matrix_world @ Vector(coord) for coord in part.bound_box]
-
-    # Calculate the center coordinates of the part
-    center_x = sum([v.x for v in bounding_box_world_coords]) / 8
-    center_y = sum([v.y for v in bounding_box_world_coords]) / 8
-    center_z = sum([v.z for v in bounding_box_world_coords]) / 8
-
-    part_center = (center_x, center_y, center_z)
+    """Return the center and the dimensions of the part's bounding box in world coordinates."""
+    low, high = mesh_utils.world_bounds(part)
+    part_center = tuple((low + high) / 2)
     part_dimensions = (part.dimensions[0], part.dimensions[1], part.dimensions[2])
     return part_center, part_dimensions
 
-def create_cutting_cube(part_center, part_dimensions, axis, cut_size):
-    center = part_center
-
-    # Create a cube to use for cutting
-    bpy.ops.mesh.primitive_cube_add(size=1, enter_editmode=False, align='WORLD', location=(0, 0, 0))
-    cube = bpy.context.active_object
-
-    # Set the dimensions of the cube based on the cut axis
-    if axis == 'x':
-        cube.dimensions = [cut_size, part_dimensions[1] + 1, part_dimensions[2] + 1]
-        cube.location.x = center[0] - cut_size/2 + part_dimensions[0]/2
-        cube.location.y = center[1]
-        cube.location.z = center[2]
-
-    elif axis == 'y':
-        cube.dimensions = [part_dimensions[0]+1, cut_size, part_dimensions[2]+1]
-        cube.location.x = center[0]
-        cube.location.y = center[1] - cut_size/2 + part_dimensions[1]/2
-        cube.location.z = center[2]
-        
-    elif axis == 'z':
-        cube.dimensions = [part_dimensions[0]+1, part_dimensions[1]+1, cut_size]
-        cube.location.x = center[0]
-        cube.location.y = center[1]
-        cube.location.z = center[2] - cut_size/2 + part_dimensions[2]/2
-
-    return cube
-
-def apply_array_modifier(cube, axis, part_dimensions, cut_size):
-    """Apply an array modifier to the cube."""
-    bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
-    bpy.ops.object.modifier_add(type='ARRAY')
-
-    # Access the last added modifier (which should be the Array modifier)
-    array_modifier = cube.modifiers[-1]  # Access the last modifier
-
-    if axis == 'x':
-        array_modifier.count = int(part_dimensions[0]/cut_size)+1
-        array_modifier.relative_offset_displace[0] = RELATIVE_OFFSET
-    elif axis == 'y':
-        array_modifier.count = int(part_dimensions[1]/cut_size)+1
-        array_modifier.relative_offset_displace[0] = 0
-        array_modifier.relative_offset_displace[1] = RELATIVE_OFFSET
-    elif axis == 'z':
-        array_modifier.count = int(part_dimensions[2]/cut_size)+1
-        array_modifier.relative_offset_displace[0] = 0
-        array_modifier.relative_offset_displace[2] = RELATIVE_OFFSET
-    else:
+def cutting_cells(part_center, part_dimensions, axis, cut_size):
+    """Return the (min, max) corners of the cutting cubes laid from the top of the part down the axis.
+    The cubes are as wide as the part plus a margin and RELATIVE_OFFSET apart along the axis."""
+    if axis not in AXIS_INDEX:
         raise ValueError(f"Invalid axis: {axis}")
-
-    # Apply the modifier using its actual name
-    bpy.ops.object.modifier_apply(modifier=array_modifier.name)
-    
-    return cube
+    index = AXIS_INDEX[axis]
+
+    size = Vector(part_dimensions) + Vector((1, 1, 1))
+    size[index] = cut_size
+    center = Vector(part_center)
+    center[index] += part_dimensions[index] / 2 - cut_size / 2
+    step = Vector((0, 0, 0))
+    step[index] = cut_size * RELATIVE_OFFSET
+
+    count = int(part_dimensions[index] / cut_size) + 1
+    return [(center + step * i - size / 2, center + step * i + size / 2) for i in range(count)]
+
+@profiling.stage("cubit: create cubes")
+def new_cube(low, high, collection):
+    """Create a box object between the low and high corners in the collection."""
+    return mesh_utils.new_mesh_object("Cube", mesh_utils.box_vertices(low, high), mesh_utils.BOX_FACES, collection)
+
+@profiling.stage("cubit: create cubes")
+def new_cubes(cells, collection):
+    """Create a single object holding one box per (low, high) cell, used as one merged cutter."""
+    vertices = []
+    faces = []
+    for low, high in cells:
+        offset = len(vertices)
+        vertices.extend(mesh_utils.box_vertices(low, high))
+        faces.extend([index + offset for index in face] for face in mesh_utils.BOX_FACES)
+    return mesh_utils.new_mesh_object("Cube", vertices, faces, collection)
+
+@profiling.stage("cubit: boolean")
+def boolean_parts(part, cubes):
+    """Intersect every cube with the part, evaluating all the Booleans in one depsgraph update."""
+    for cube in cubes:
+        boolean_modifier = cube.modifiers.new(name="Boolean", type='BOOLEAN')
+        boolean_modifier.operation = 'INTERSECT'
+        boolean_modifier.solver = 'FAST'
+        boolean_modifier.object = part
+    mesh_utils.apply_modifiers(cubes)
 
 def boolean_part(part, cube):
- 
-    # Deselect all objects
-    bpy.ops.object.select_all(action='DESELECT')
-
-    # Select the cube and make it the active object
-    cube.select_set(True)
-    bpy.context.view_layer.objects.active = cube
-
-    # Add a Boolean modifier to the cube
-    bpy.ops.object.modifier_add(type='BOOLEAN')
-
-    # Access the last added modifier, which is the Boolean modifier
-    boolean_modifier = cube.modifiers[-1]
-
-    # Configure the Boolean modifier
-    boolean_modifier.operation = 'INTERSECT'
-    boolean_modifier.solver = 'FAST'
-    boolean_modifier.object = part
-
-    # Apply the modifier
-    bpy.ops.object.modifier_apply(modifier=boolean_modifier.name)
-    #update viewport3D
-    bpy.context.view_layer.update()
+    boolean_parts(part, [cube])
 
     
+@profiling.stage("cubit: separate parts")
 def separate_parts(parts):
-
-    bpy.ops.object.select_all(action='DESELECT')
-    parts.select_set(True)
-    #make the part the active object
-    bpy.context.view_layer.objects.active = parts
     original_name = parts.name
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.separate(type='LOOSE')
-    bpy.ops.object.mode_set(mode='OBJECT')
+    return mesh_utils.separate_loose(parts), original_name
 
-    return bpy.context.selected_objects, original_name
 
+def part_base_name(original_name):
+    return original_name if original_name.startswith("Part") else "Part"
 
-def enumerate_parts(parts, original_name):     
-    #TODO: fix the enumerator function and implement the cleanup afterwards of useless parts         
-    """
-    for i, part in enumerate(parts):
-        if part.name[:4] != "Part":
-            part.name = "Part_" + str(i+1)
-        else:
-            part.name += original_name + "_" + str(i+1)
-    """
-    pass
 
-
-def cut_part(part, axis, cut_size, parts_collection):
-     
+def enumerate_parts(parts, original_name):
+    """Name the parts after the part they were cut from: Part_1, Part_2, then Part_1_1, Part_1_2..."""
+    base_name = part_base_name(original_name)
+    for i, part in enumerate(parts):
+        part.name = f"{base_name}_{i + 1}"
+
+
+@profiling.stage("cubit: part index")
+def build_part_index(part, index):
+    """Return the BVH tree of the part's surface and its vertices sorted along the axis index, in world coordinates."""
+    vertices = mesh_utils.world_vertices(part)
+    return spatial_index.bvh_tree(part), vertices[np.argsort(vertices[:, index], kind="stable")]
+
+
+@profiling.stage("cubit: classify cells")
+def classify_box(bvh, vertices, index, low, high):
+    """Return 'EMPTY', 'FULL' or 'BOUNDARY' for the box between low and high against the part indexed by
+    build_part_index along the axis index."""
+    if any(low[i] >= high[i] for i in range(3)):
+        return 'EMPTY'
+
+    # A vertex inside the box, this also finds loose pieces of the part lying completely inside it
+    start, stop = np.searchsorted(vertices[:, index], (low[index], high[index]), side="right")
+    candidates = vertices[start:stop]
+    if np.any(np.all((candidates > tuple(low)) & (candidates < tuple(high)), axis=1)):
+        return 'BOUNDARY'
+    # The surface crosses the faces of the box
+    box_bvh = BVHTree.FromPolygons(mesh_utils.box_vertices(low, high), mesh_utils.BOX_FACES)
+    if bvh.overlap(box_bvh):
+        return 'BOUNDARY'
+
+    # The surface does not reach the box: it is either completely inside or outside the part
+    center = (low + high) / 2
+    location, normal, _, _ = bvh.find_nearest(center)
+    if location is not None and normal.dot(center - location) < 0:
+        return 'FULL'
+    return 'EMPTY'
+
+
+@profiling.stage("cubit: cut part")
+def cut_part(part, axis, cut_size, parts_collection, cells=None, batched=False, classify=True):
+    """Cut the part into slabs along the axis and return the new parts in parts_collection.
+    When cells is given, only the cubes with these indices (counted from the top) are used.
+    When batched, all the boundary cubes are merged into one cutter and intersected with a single Boolean,
+    the gaps between the cubes keep the pieces apart for the separation.
+    When classify, the cubes are first clipped to the bounding box of the part: the clipped cubes holding
+    nothing of the part are skipped, and the ones lying completely inside it are kept as boxes without a Boolean."""
     part_center, part_dimensions = get_part_center(part)
-    cube = create_cutting_cube(part_center, part_dimensions, axis, cut_size)
-    cubes = apply_array_modifier(cube, axis, part_dimensions, cut_size)
-    cube_to_parts, original_name = separate_parts(cubes)
-    enumerate_parts(cube_to_parts, original_name) 
-    
-    for cube in cube_to_parts:
-        boolean_part(part, cube)
-        parts_collection.objects.link(cube)
-        bpy.context.collection.objects.unlink(cube)
-        
-    for part in parts_collection.objects:
-        cube_to_parts, original_name = separate_parts(part)
-        enumerate_parts(cube_to_parts, original_name) 
-        
-
-def create_collection(name):
-    """Create a new collection and link it to the scene."""
+    cube_cells = cutting_cells(part_center, part_dimensions, axis, cut_size)
+    if cells is not None:
+        cube_cells = [cell for i, cell in enumerate(cube_cells) if i in cells]
+    index = AXIS_INDEX[axis]
+    if classify:
+        bvh, vertices = build_part_index(part, index)
+        classify = len(vertices) > 0
+    if classify:
+        part_low, part_high = Vector(vertices.min(axis=0)), Vector(vertices.max(axis=0))
+        margin = Vector((1, 1, 1)) * cut_size * CELL_MARGIN
+
+    new_parts = []
+    boundary_cubes = []
+    boundary_cells = []
+    for cell_min, cell_max in cube_cells:
+        cell = 'BOUNDARY'
+        if classify:
+            # The cube only meets the part inside the part's bounding box
+            low = Vector([max(cell_min[i], part_low[i]) for i in range(3)])
+            high = Vector([min(cell_max[i], part_high[i]) for i in range(3)])
+            cell = classify_box(bvh, vertices, index, low + margin, high - margin)
+        if cell == 'EMPTY':
+            # Nothing of the part in this cube, skip it
+            continue
+        if cell == 'FULL':
+            # The clipped cube already is the intersection of the cube with the part
+            new_parts.append(new_cube(low, high, parts_collection))
+            continue
+        if batched:
+            boundary_cells.append((cell_min, cell_max))
+            continue
+        cube = new_cube(cell_min, cell_max, parts_collection)
+        new_parts.append(cube)
+        boundary_cubes.append(cube)
+
+    if boundary_cells:
+        cutter = new_cubes(boundary_cells, parts_collection)
+        new_parts.append(cutter)
+        boundary_cubes.append(cutter)
+    boolean_parts(part, boundary_cubes)
+
+    # Only the pieces of this call are separated, the parts already in the collection are done
+    pieces = []
+    for new_part in new_parts:
+        separated, _ = separate_parts(new_part)
+        pieces.extend(separated)
+    enumerate_parts(pieces, part.name)
+    return pieces
+
+
+def create_collection(name, transient=False):
+    """Create a new collection and link it to the scene. The trees of the objects in a transient collection are
+    not cached by spatial_index."""
     collection = bpy.data.collections.new(name)
+    if transient:
+        collection[spatial_index.TRANSIENT_PROPERTY] = True
     bpy.context.scene.collection.children.link(collection)
     return collection
 
 def delete_collection(collection):
     """Delete a collection and all its objects."""
-    for obj in collection.objects:
-        bpy.data.objects.remove(obj)
+    for obj in list(collection.objects):
+        mesh_utils.remove_object(obj)
     bpy.data.collections.remove(collection)
 
 
-def cubit(obj, print_size):
-    
+def grid_planes(low, high, cut_size):
+    """Return the planes between the cubes cutting_cells would lay from high down to low."""
+    pitch = cut_size * abs(RELATIVE_OFFSET)
+    gap = pitch - cut_size
+    count = int((high - low) / cut_size) + 1
+    planes = [high - i * pitch + gap / 2 for i in range(1, count)]
+    return [plane for plane in planes if plane > low]
+
+
+def nearest_plane(value, planes):
+    """Return the plane the value lies on, or None if it is not on any of them."""
+    i = bisect_left(planes, value)
+    for plane in planes[max(i - 1, 0):i + 1]:
+        if abs(plane - value) <= SLICE_EPSILON:
+            return plane
+    return None
+
+
+def fill_caps(bm, index, normal, planes, cut_layer):
+    """Close the open cuts of every loose part lying on one of the planes. Only the edges marked in the cut_layer
+    edge layer are capped, the holes the mesh already had stay open."""
+    for island in mesh_utils.bmesh_islands(bm):
+        center = sum(vert.co[index] for vert in island) / len(island)
+        boundary = dict.fromkeys(
+            edge for vert in island for edge in vert.link_edges if edge.is_boundary and edge[cut_layer]
+        )
+        caps = {}
+        for edge in boundary:
+            plane = nearest_plane(edge.verts[0].co[index], planes)
+            if plane is not None and plane == nearest_plane(edge.verts[1].co[index], planes):
+                caps.setdefault(plane, []).append(edge)
+
+        for plane, edges in caps.items():
+            direction = normal if plane > center else -normal
+            result = bmesh.ops.triangle_fill(bm, use_beauty=True, use_dissolve=False, edges=edges, normal=direction)
+            for face in result['geom']:
+                if isinstance(face, bmesh.types.BMFace):
+                    face.normal_update()
+                    if face.normal.dot(direction) < 0:
+                        face.normal_flip()
+
+
+@profiling.stage("cubit: slice")
+def cut_bmesh(bm, index, cuts):
+    """Cut groups of vertices of the bmesh along planes normal to the axis index and cap the cuts.
+    cuts is a list of (vertices, planes) pairs, one per loose part to cut."""
+    normal = Vector((0, 0, 0))
+    normal[index] = 1
+    cut_edges = []
+    all_planes = set()
+
+    for group, planes in cuts:
+        geom = mesh_utils.island_geometry(group)
+        for plane in planes:
+            result = bmesh.ops.bisect_plane(bm, geom=geom, dist=SLICE_EPSILON, plane_co=normal * plane, plane_no=normal)
+            geom = result['geom']
+            cut_edges.extend(edge for edge in result['geom_cut'] if isinstance(edge, bmesh.types.BMEdge))
+            all_planes.add(plane)
+
+    if not cut_edges:
+        return
+    # Mark the cut edges, split_edges copies the mark to the edges it adds
+    cut_layer = bm.edges.layers.int.new("chopchop_cut")
+    for edge in cut_edges:
+        edge[cut_layer] = 1
+    # Disconnect the pieces along the cuts, then cap each side
+    bmesh.ops.split_edges(bm, edges=cut_edges)
+    fill_caps(bm, index, normal, sorted(all_planes), cut_layer)
+    bm.edges.layers.int.remove(cut_layer)
+
+
+def slice_bmesh(bm, axis, cut_size, whole=False):
+    """Slice every loose part of the bmesh (or the whole bmesh) into capped slabs along the axis."""
+    index = AXIS_INDEX[axis]
+    groups = [bm.verts[:]] if whole else mesh_utils.bmesh_islands(bm)
+    cuts = []
+    for group in groups:
+        if not group:
+            continue
+        values = [vert.co[index] for vert in group]
+        # The grid is aligned to each part, like the cutting cubes of cut_part
+        cuts.append((group, grid_planes(min(values), max(values), cut_size)))
+    cut_bmesh(bm, index, cuts)
+
+
+def keep_slabs(bm, axis, cut_size, cells):
+    """Delete the loose parts of the bmesh whose slab, counted from the top, is not in cells."""
+    index = AXIS_INDEX[axis]
+    values = [vert.co[index] for vert in bm.verts]
+    planes = grid_planes(min(values), max(values), cut_size)
+    for island in mesh_utils.bmesh_islands(bm):
+        center = sum(vert.co[index] for vert in island) / len(island)
+        if sum(plane > center for plane in planes) not in cells:
+            bmesh.ops.delete(bm, geom=island, context='VERTS')
+
+
+def slice_part_steps(part, cut_size, parts_collection, z_cells=None):
+    """Cut the part into grid cells by slicing its mesh along the grid planes, without Booleans.
+    Job generator (see jobs.py) returning the parts."""
+    bm = mesh_utils.object_to_bmesh(part)
+    # The bmesh is freed even when the job is cancelled between two steps
+    try:
+        # The first pass cuts the whole object, the next ones every loose part it produced
+        slice_bmesh(bm, "z", cut_size, whole=True)
+        if z_cells is not None and bm.verts:
+            keep_slabs(bm, "z", cut_size, z_cells)
+        yield 0.25
+        slice_bmesh(bm, "x", cut_size)
+        yield 0.5
+        slice_bmesh(bm, "y", cut_size)
+        yield 0.75
+        return bmesh_to_parts(bm, part, parts_collection)
+    finally:
+        bm.free()
+
+
+@profiling.stage("cubit: build parts")
+def bmesh_to_parts(bm, part, parts_collection):
+    """Turn every loose part of the bmesh into a part object, named after the part and with its materials and
+    attribute layers."""
+    islands = [island for island in mesh_utils.bmesh_islands(bm) if any(vert.link_faces for vert in island)]
+    parts = []
+    if islands:
+        # The bmesh is in world coordinates, the parts get the mesh settings of the part but no transform
+        base = bpy.data.objects.new("Part", part.data.copy())
+        parts_collection.objects.link(base)
+        parts = mesh_utils.islands_to_objects(bm, islands, base)
+    enumerate_parts(parts, part.name)
+    return parts
+
+
+def fit_cut(low, high, build_volume):
+    """Return the (axis index, plane) of the cut for a part too large for the build volume, or None if it fits.
+    The part may lie along any axis of the printer, so the sorted dimensions are compared. The longest
+    overflowing side is cut where the number of printer lengths it needs is split evenly."""
+    dimensions = high - low
+    order = sorted(range(3), key=lambda i: dimensions[i])
+    overflowing = [(dimensions[i], i, limit) for i, limit in zip(order, sorted(build_volume)) if dimensions[i] > limit]
+    if not overflowing:
+        return None
+    dimension, index, limit = max(overflowing)
+    count = math.ceil(dimension / limit)
+    return index, low[index] + dimension * (count // 2) / count
+
+
+def fit_part_steps(part, build_volume, parts_collection):
+    """Cut the part only where it does not fit the printer's build volume (x, y, z).
+    Every round cuts each oversized loose part once, until all of them fit. Raise a RuntimeError if some parts
+    still do not fit after MAX_FIT_ROUNDS rounds.
+    Job generator (see jobs.py) returning the parts."""
+    bm = mesh_utils.object_to_bmesh(part)
+    # The bmesh is freed even when the job is cancelled between two rounds
+    try:
+        for rounds in range(MAX_FIT_ROUNDS + 1):
+            cuts = {0: [], 1: [], 2: []}
+            for island in mesh_utils.bmesh_islands(bm):
+                low = Vector([min(vert.co[i] for vert in island) for i in range(3)])
+                high = Vector([max(vert.co[i] for vert in island) for i in range(3)])
+                cut = fit_cut(low, high, build_volume)
+                if cut is not None:
+                    index, plane = cut
+                    cuts[index].append((island, [plane]))
+            if not any(cuts.values()):
+                break
+            if rounds == MAX_FIT_ROUNDS:
+                oversized = sum(len(axis_cuts) for axis_cuts in cuts.values())
+                raise RuntimeError(f"{oversized} parts still do not fit the build volume after {MAX_FIT_ROUNDS} rounds")
+            # Each loose part is cut once per round, so the cuts along one axis leave the others valid
+            for index, axis_cuts in cuts.items():
+                if axis_cuts:
+                    cut_bmesh(bm, index, axis_cuts)
+            # The number of rounds is not known up front, every round halves what is left to do
+            yield 1 - 0.5 ** (rounds + 1)
+        return bmesh_to_parts(bm, part, parts_collection)
+    finally:
+        bm.free()
+
+
+def cubit(obj, print_size, engine='BOOLEAN', z_cells=None, build_volume=None, batched=False, classify=True):
+    """Cut the object into cubes of print_size and return the parts.
+    Only the z slabs in z_cells are kept when it is given. The 'FIT' engine ignores both and only
+    cuts the parts that do not fit the build_volume (x, y, z). batched and classify are passed on to cut_part."""
+    return jobs.run(cubit_steps(obj, print_size, engine, z_cells, build_volume, batched, classify))
+
+
+def cubit_steps(obj, print_size, engine='BOOLEAN', z_cells=None, build_volume=None, batched=False, classify=True):
+    """Job generator of cubit (see jobs.py), returning the parts."""
+
+    # Same result collection as the last pass of the Boolean engine
+    if engine == 'SLICE':
+        parts = yield from slice_part_steps(obj, print_size, create_collection("y Parts"), z_cells)
+        obj.hide_viewport = True
+        return parts
+    if engine == 'FIT':
+        parts = yield from fit_part_steps(obj, build_volume, create_collection("y Parts"))
+        obj.hide_viewport = True
+        return parts
+
     # Create collections
-    z_parts_collection = create_collection("z Parts")
-    x_parts_collection = create_collection("x Parts")
+    z_parts_collection = create_collection("z Parts", transient=True)
+    x_parts_collection = create_collection("x Parts", transient=True)
     y_parts_collection = create_collection("y Parts")
 
-    cut_part(obj, "z", print_size, z_parts_collection)
+    cut_part(obj, "z", print_size, z_parts_collection, z_cells, batched, classify)
+    yield 0.1
     #TODO: Implement the following 
     #check if the part should be cut
     #enumerate the parts
 
 
 
-    for part in z_parts_collection.objects:
-        cut_part(part,"x",print_size,x_parts_collection)
+    z_parts = list(z_parts_collection.objects)
+    for i, part in enumerate(z_parts):
+        cut_part(part,"x",print_size,x_parts_collection, batched=batched, classify=classify)
+        yield 0.1 + 0.4 * (i + 1) / len(z_parts)
         #TODO: Implement the following
         #check if the part is too small or basically a cube so they will be discarted or set aside    
     delete_collection(z_parts_collection)
-    for part in x_parts_collection.objects:
-        cut_part(part,"y",print_size,y_parts_collection)
+    x_parts = list(x_parts_collection.objects)
+    for i, part in enumerate(x_parts):
+        cut_part(part,"y",print_size,y_parts_collection, batched=batched, classify=classify)
+        yield 0.5 + 0.5 * (i + 1) / len(x_parts)
     delete_collection(x_parts_collection)
     obj.hide_viewport = True
-
+    return list(y_parts_collection.objects)
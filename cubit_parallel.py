@@ -0,0 +1,135 @@
+import bpy
+import os
+import subprocess
+import tempfile
+import time
+import cubit
+import jobs
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.realpath(__file__)), "cubit_worker.py")
+ORDER_PROPERTY = "cubit_order"
+NAME_PROPERTY = "cubit_name"
+# Seconds to wait between two checks of the running workers
+POLL_INTERVAL = 0.02
+# Last lines of the output of a failed worker shown in the error
+ERROR_LINES = 5
+
+
+def split_cells(count, workers):
+    """Split the z slabs into at most `workers` contiguous chunks, from the top down."""
+    size = -(-count // workers)
+    return [range(start, min(start + size, count)) for start in range(0, count, size)]
+
+
+def start_worker(source_path, result_path, log_path, print_size, engine, batched, chunk, cells):
+    """Start cubit on a chunk of z slabs in a background Blender process, its errors going to log_path."""
+    command = [
+        bpy.app.binary_path, "--background", "--factory-startup", "--python-exit-code", "1",
+        "--python", WORKER_SCRIPT, "--",
+        source_path, result_path, str(print_size), engine, str(int(batched)), str(chunk),
+        str(cells.start), str(cells.stop),
+    ]
+    # A file rather than a pipe, which would block the worker once full since nobody reads it while it runs
+    with open(log_path, "w") as log_file:
+        return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=log_file)
+
+
+def worker_error(log_path, cells):
+    """Return the error of a worker that failed on the z slabs cells, with the end of its output."""
+    with open(log_path, errors="replace") as log_file:
+        lines = [line.strip() for line in log_file if line.strip()]
+    details = " | ".join(lines[-ERROR_LINES:]) or "no output"
+    return RuntimeError(f"cubit worker for z slabs {cells.start}-{cells.stop - 1} failed: {details}")
+
+
+def load_parts(result_path):
+    """Load the parts written by a worker, in the order the worker produced them, with the names the worker gave
+    them."""
+    with bpy.data.libraries.load(result_path) as (data_from, data_to):
+        data_to.objects = data_from.objects
+    parts = sorted((part for part in data_to.objects if part), key=lambda part: part[ORDER_PROPERTY])
+    names = [part[NAME_PROPERTY] for part in parts]
+    for part in parts:
+        del part[ORDER_PROPERTY]
+        del part[NAME_PROPERTY]
+    return parts, names
+
+
+def merged_names(chunk_names, original_name):
+    """Return the names the serial path gives the parts of all the chunks. Every worker numbers the pieces of its
+    z slabs from 1, Part_1_2_1 being the first part of the second x piece of its first z piece, and the serial path
+    numbers the z pieces of all the slabs in a row, so the z numbers of a chunk follow those of the chunks above."""
+    base_name = cubit.part_base_name(original_name)
+    names = []
+    offset = 0
+    for chunk in chunk_names:
+        numbers = []
+        for name in chunk:
+            number, _, rest = name[len(base_name) + 1:].partition("_")
+            numbers.append(int(number))
+            names.append(f"{base_name}_{int(number) + offset}" + (f"_{rest}" if rest else ""))
+        offset += max(numbers, default=0)
+    return names
+
+
+def cubit_parallel(obj, print_size, engine='BOOLEAN', workers=2, batched=False):
+    """Cut the object like cubit.cubit, farming chunks of z slabs out to `workers` Blender processes."""
+    return jobs.run(cubit_parallel_steps(obj, print_size, engine, workers, batched))
+
+
+def cubit_parallel_steps(obj, print_size, engine='BOOLEAN', workers=2, batched=False):
+    """Job generator of cubit_parallel (see jobs.py), returning the parts.
+    Closing it kills the workers still running."""
+    count = int(obj.dimensions[2] / print_size) + 1
+    chunks = split_cells(count, workers)
+
+    with tempfile.TemporaryDirectory(prefix="chopchop_") as folder:
+        source_path = os.path.join(folder, "source.blend")
+        bpy.data.libraries.write(source_path, {obj})
+        result_paths = [os.path.join(folder, f"slab_{i}.blend") for i in range(len(chunks))]
+
+        pending = list(enumerate(chunks))
+        # (process, log path, cells) of the workers started and not checked yet
+        running = []
+        finished = 0
+        try:
+            while pending or running:
+                while pending and len(running) < workers:
+                    chunk, cells = pending.pop(0)
+                    log_path = os.path.join(folder, f"slab_{chunk}.log")
+                    process = start_worker(
+                        source_path, result_paths[chunk], log_path, print_size, engine, batched, chunk, cells
+                    )
+                    running.append((process, log_path, cells))
+                for worker in [worker for worker in running if worker[0].poll() is not None]:
+                    running.remove(worker)
+                    process, log_path, cells = worker
+                    if process.returncode != 0:
+                        raise worker_error(log_path, cells)
+                    finished += 1
+                yield 0.9 * finished / len(chunks)
+                time.sleep(POLL_INTERVAL)
+        finally:
+            for process, _, _ in running:
+                process.kill()
+                process.wait()
+
+        # Merge from the top slab down so the parts come out in the same order as the serial path
+        parts_collection = cubit.create_collection("y Parts")
+        parts = []
+        chunk_names = []
+        for result_path in result_paths:
+            chunk_parts, names = load_parts(result_path)
+            for part in chunk_parts:
+                parts_collection.objects.link(part)
+            parts.extend(chunk_parts)
+            chunk_names.append(names)
+
+    # The names of the parts of different chunks clash until all of them are renamed
+    for i, part in enumerate(parts):
+        part.name = f"cubit merge {i}"
+    for part, name in zip(parts, merged_names(chunk_names, obj.name)):
+        part.name = name
+
+    obj.hide_viewport = True
+    return parts
@@ -0,0 +1,43 @@
+"""Background worker of cubit_parallel, started as:
+blender --background --python cubit_worker.py -- source result print_size engine batched chunk start stop
+It cuts the z slabs start to stop of the object in the source file and writes the parts to the result file, with
+their order and their names, numbered from 1 in every chunk, for cubit_parallel to number them like the serial path."""
+import bpy
+import sys
+import os
+
+# Get the current directory of the script being run
+current_dir = os.path.dirname(os.path.realpath(__file__))
+
+# Add the current directory to the Python path
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+import cubit
+from cubit_parallel import NAME_PROPERTY, ORDER_PROPERTY
+
+
+def main(argv):
+    source_path, result_path, print_size, engine, batched, chunk, start, stop = argv
+
+    # Start from an empty scene
+    for obj in list(bpy.data.objects):
+        bpy.data.objects.remove(obj)
+
+    with bpy.data.libraries.load(source_path) as (data_from, data_to):
+        data_to.objects = data_from.objects
+    obj = data_to.objects[0]
+    bpy.context.scene.collection.objects.link(obj)
+
+    cubit.cubit(obj, float(print_size), engine, range(int(start), int(stop)), batched=bool(int(batched)))
+
+    parts = list(bpy.data.collections["y Parts"].objects)
+    for i, part in enumerate(parts):
+        part[ORDER_PROPERTY] = i
+        # Loading the parts of several workers into one file renames the ones with the same name
+        part[NAME_PROPERTY] = part.name
+    bpy.data.libraries.write(result_path, set(parts))
+
+
+if __name__ == "__main__":
+    main(sys.argv[sys.argv.index("--") + 1:])
@@ -1,7 +1,12 @@
 import bpy
 import bmesh
 import mathutils
+import numpy as np
 import time
+import jobs
+import mesh_utils
+import profiling
+import spatial_index
 
 
 def set_drawing(color):
@@ -46,149 +51,264 @@ def set_drawing(color):
     gpencil.color = color
 
 
+@profiling.stage("curve_cut: delete far points")
 def delete_far_points(gpencil_obj, selected_obj):
     threshold = 0.5  # The threshold distance for removing points
-    # Create a BVH tree from the selected object
-    bm = bmesh.new()
-    bm.from_mesh(selected_obj.data)
-    bm.transform(selected_obj.matrix_world)
-    bvh = mathutils.bvhtree.BVHTree.FromBMesh(bm)
+    matrix = np.array(gpencil_obj.matrix_world)
 
-    # Iterate over the points in each stroke of each layer
     for layer in gpencil_obj.data.layers:
         for frame in layer.frames:
-            for stroke in frame.strokes:
-                points_to_remove = []
-                for i, point in enumerate(stroke.points):
-                    # Calculate the distance from the point to the selected object
-                    nearest_point, _, _, _ = bvh.find_nearest(point.co)
-                    distance = (nearest_point - point.co).length
-                    # If the distance is greater than the threshold, mark the point for removal
-                    if distance > threshold:
-                        points_to_remove.append(i)
-                # Remove the marked points
-                for i in sorted(points_to_remove, reverse=True):
-                    stroke.points.pop(index=i)
-    bm.free()
+            strokes = list(frame.strokes)
+            if not strokes:
+                continue
+            chunks = []
+            for stroke in strokes:
+                coordinates = np.empty(len(stroke.points) * 3, dtype=np.float32)
+                stroke.points.foreach_get("co", coordinates)
+                chunks.append(coordinates.reshape(-1, 3))
+            points = np.concatenate(chunks) @ matrix[:3, :3].T + matrix[:3, 3]
+            # All the points of the frame are measured at once, the ones farther than the threshold get the threshold
+            keep = spatial_index.surface_distances(selected_obj, points, threshold) < threshold
+            keeps = np.split(keep, np.cumsum([len(chunk) for chunk in chunks])[:-1])
 
+            changed = [i for i, stroke_keep in enumerate(keeps) if not stroke_keep.all()]
+            if not changed:
+                continue
+            # New strokes go to the end of the frame, so every stroke from the first changed one on is rebuilt in order
+            for stroke, stroke_keep in zip(strokes[changed[0]:], keeps[changed[0]:]):
+                if stroke_keep.any():
+                    filter_stroke(frame, stroke, stroke_keep)
+                frame.strokes.remove(stroke)
 
-#shrinkwap a gpencil around a mesh and apply it afterwards
-def shrinkwrap_modifier(gpencil_obj, selected_obj):
-    # Ensure we're in Object mode
-    if bpy.context.active_object.mode != 'OBJECT':
-        bpy.ops.object.mode_set(mode='OBJECT')
-    # Deselect all objects
-    bpy.ops.object.select_all(action='DESELECT')
-    
-    # Select the grease pencil object
-    gpencil_obj.select_set(True)
-    bpy.context.view_layer.objects.active = gpencil_obj
-    
-    # Add the Shrinkwrap modifier using the low-level API
-    sw_modifier = gpencil_obj.grease_pencil_modifiers.new(name="Shrinkwrap", type='SHRINKWRAP')
-    sw_modifier.target = selected_obj
-    sw_modifier.wrap_method = 'TARGET_PROJECT'
-    sw_modifier.offset = 0.2
-    sw_modifier.wrap_mode = 'ABOVE_SURFACE'
-    sw_modifier.smooth_factor = 1
-    sw_modifier.smooth_step = 4
-    
-    # Update the dependency graph
-    bpy.context.view_layer.update()
 
-    bpy.ops.object.gpencil_modifier_apply(modifier="Shrinkwrap")
+# Types of the point attributes copied by filter_stroke, by RNA property type
+POINT_ATTRIBUTE_TYPES = {'FLOAT': np.float32, 'INT': np.int32, 'BOOLEAN': bool}
+STROKE_PROPERTIES = (
+    "line_width", "material_index", "use_cyclic", "display_mode", "hardness", "start_cap_mode", "end_cap_mode",
+    "vertex_color_fill", "uv_rotation", "uv_translation", "uv_scale", "select",
+)
+
+
+def point_attributes(point):
+    """Return the (name, values per point, dtype) of every writable attribute of a stroke point."""
+    attributes = []
+    for prop in point.bl_rna.properties:
+        if prop.is_readonly or prop.type not in POINT_ATTRIBUTE_TYPES:
+            continue
+        attributes.append((prop.identifier, max(prop.array_length, 1), POINT_ATTRIBUTE_TYPES[prop.type]))
+    return attributes
+
+
+def filter_stroke(frame, stroke, keep):
+    """Add a copy of the stroke to the frame with only the points where keep is True, in one bulk write per attribute."""
+    new_stroke = frame.strokes.new()
+    for name in STROKE_PROPERTIES:
+        setattr(new_stroke, name, getattr(stroke, name))
+    new_stroke.points.add(int(keep.sum()))
+    for name, size, dtype in point_attributes(stroke.points[0]):
+        values = np.empty(len(stroke.points) * size, dtype=dtype)
+        stroke.points.foreach_get(name, values)
+        new_stroke.points.foreach_set(name, values.reshape(-1, size)[keep].ravel())
+    new_stroke.points.update()
+    return new_stroke
+
+
+def stroke_polyline(gpencil_obj):
+    """Return the points of all the strokes in the active frames, joined in order, in world coordinates."""
+    chunks = []
+    for layer in gpencil_obj.data.layers:
+        if layer.active_frame is None:
+            continue
+        for stroke in layer.active_frame.strokes:
+            coordinates = np.empty(len(stroke.points) * 3, dtype=np.float32)
+            stroke.points.foreach_get("co", coordinates)
+            chunks.append(coordinates.reshape(-1, 3))
+    if not chunks:
+        return np.empty((0, 3))
+    points = np.concatenate(chunks).astype(np.float64)
+    matrix = np.array(gpencil_obj.matrix_world)
+    return points @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def resample_polyline(points, length):
+    """Place points every length along the closed polyline, like gpencil.stroke_sample."""
+    closed = np.vstack((points, points[:1]))
+    distances = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(closed, axis=0), axis=1))))
+    count = max(int(distances[-1] / length), 3)
+    samples = np.linspace(0.0, distances[-1], count, endpoint=False)
+    return np.column_stack([np.interp(samples, distances, closed[:, axis]) for axis in range(3)])
+
+
+def smooth_polyline(points, factor, steps):
+    """Move every point of the closed polyline towards the middle of its neighbours."""
+    for _ in range(steps):
+        points = points * (1 - factor) + (np.roll(points, 1, axis=0) + np.roll(points, -1, axis=0)) * (factor / 2)
+    return points
+
 
+def project_polyline(points, bvh, offset):
+    """Move every point to the nearest point of the surface, offset along its normal,
+    like a shrinkwrap modifier in TARGET_PROJECT mode above the surface."""
+    projected = np.empty_like(points)
+    for i, co in enumerate(points.tolist()):
+        location, normal, _, _ = bvh.find_nearest(co)
+        projected[i] = location + normal * offset if location is not None else co
+    return projected
 
-#refine and join the strokes
+
+#join, close and resample the strokes, project them on the object and turn them into a cut line mesh
+@profiling.stage("curve_cut: refine drawing")
 def refine_drawing(gpencil_obj, selected_obj):
-    #make the grease pencil object active
-    bpy.context.view_layer.objects.active = gpencil_obj
     delete_far_points(gpencil_obj, selected_obj)
-    bpy.ops.object.mode_set(mode='EDIT_GPENCIL')
-    bpy.ops.gpencil.select_all(action='SELECT')
-    bpy.ops.gpencil.stroke_join(type='JOIN')
-    bpy.ops.gpencil.stroke_cyclical_set(type='CLOSE', geometry=True) 
-    bpy.ops.gpencil.select_all(action='SELECT')  
-    bpy.ops.gpencil.stroke_sample(length=0.1, sharp_threshold=0.0)
-
-    bpy.ops.object.mode_set(mode='OBJECT')
-    # Deselect all objects
-    bpy.ops.object.select_all(action='DESELECT')
-    shrinkwrap_modifier(gpencil_obj, selected_obj)
-    # Find the 3D View area
-    bpy.context.view_layer.objects.active = gpencil_obj
- 
-    bpy.ops.object.mode_set(mode='EDIT_GPENCIL')
-    bpy.ops.gpencil.select_all(action='SELECT')
+    points = stroke_polyline(gpencil_obj)
+    if len(points) < 3:
+        return None
+    bvh = spatial_index.bvh_tree(selected_obj)
 
-    bpy.ops.gpencil.stroke_sample(length=0.3, sharp_threshold=0.0)
-    shrinkwrap_modifier(gpencil_obj, selected_obj)    
-    area = next(area for area in bpy.context.screen.areas if area.type == 'VIEW_3D')
-    # Override the context
-    override = bpy.context.copy()
-    override['area'] = area
-    # Convert grease pencil to path
-    bpy.ops.gpencil.convert(type='PATH', use_timing_data=False)
-    # Deselect the grease pencil object
-    gpencil_obj.select_set(False)
-
-    # Set the only other selected object as the active object
-    for obj in bpy.context.selected_objects:
-        if obj != gpencil_obj:
-            bpy.context.view_layer.objects.active = obj
-            break
-
-    # Convert the path to a mesh
-    bpy.ops.object.convert(target='MESH')
-    temp_mesh_obj = bpy.context.active_object  # Get the newly created mesh object
-    # Delete the original path object
-    bpy.ops.object.select_all(action='DESELECT')  # Deselect all objects
-    # Select the mesh object
-    bpy.context.view_layer.objects.active = temp_mesh_obj
-    temp_mesh_obj.select_set(True)
- 
-
-def chop_obj():
-    """
-    Consider using this to help with visualization
-    # Assuming `obj` is the object you want to always appear on top
-    obj.show_in_front = True
-    """
-    active_obj = bpy.context.object
-    bpy.context.view_layer.objects.active = active_obj
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_mode(use_extend=False, use_expand=False, type='VERT')
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.remove_doubles(threshold=0.5) 
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.edge_face_add( )
-    bpy.ops.mesh.inset(thickness=0.1, depth=0, release_confirm=True)
-    #for loop that will repeat itself for every 0.1 of the border_thickness_tool   
-    for i in range(0, round(bpy.context.scene.border_thickness/ 0.1)):
-        bpy.ops.mesh.inset(thickness=0.1, depth=0, release_confirm=True)
-        bpy.ops.mesh.remove_doubles(threshold=0.5)
-  
-    bpy.ops.mesh.remove_doubles(threshold=0.5)
-    bpy.ops.mesh.inset(thickness=0.5, depth=1, release_confirm=True)
-    bpy.ops.transform.resize(value=(1, 1, 0), orient_type='NORMAL')
-    bpy.ops.mesh.remove_doubles(threshold=0.5)
-    bpy.ops.mesh.quads_convert_to_tris(quad_method='BEAUTY', ngon_method='BEAUTY')
-    bpy.ops.mesh.select_mode(use_extend=False, use_expand=False, type='FACE')
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.extrude_context_move(TRANSFORM_OT_translate={"value":(0, 0, 0.01), "orient_type":'NORMAL'})
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.context.active_object.name = "Cut Mesh"
-    obj_cuts_collection = bpy.data.collections.get("Cutting objects")
+    points = resample_polyline(points, 0.1)
+    points = smooth_polyline(project_polyline(points, bvh, 0.2), 1.0, 4)
+    points = resample_polyline(points, 0.3)
+    points = smooth_polyline(project_polyline(points, bvh, 0.2), 1.0, 4)
+
+    count = len(points)
+    edges = [(i, (i + 1) % count) for i in range(count)]
+    mesh = bpy.data.meshes.new(gpencil_obj.name)
+    mesh.from_pydata(points.tolist(), edges, [])
+    mesh.update()
+    temp_mesh_obj = bpy.data.objects.new(gpencil_obj.name, mesh)
+    bpy.context.collection.objects.link(temp_mesh_obj)
+    return temp_mesh_obj
+
+
+def weld_loop(points, distance):
+    """Drop the points of the closed loop closer than distance to the previous kept point, like remove_doubles."""
+    kept = [points[0]]
+    for co in points[1:]:
+        if np.linalg.norm(co - kept[-1]) >= distance:
+            kept.append(co)
+    while len(kept) > 3 and np.linalg.norm(kept[-1] - kept[0]) < distance:
+        kept.pop()
+    return np.array(kept)
+
+
+def inward_directions(points, normal, bvh):
+    """Return for every point of the loop the direction of an inset of the face filling it. The surface normal of the
+    object, flattened onto the face, is used where it is defined, the bisector of the loop edges elsewhere."""
+    tangents = np.roll(points, -1, axis=0) - np.roll(points, 1, axis=0)
+    bisectors = np.cross(normal, tangents)
+    directions = np.empty_like(points)
+    for i, co in enumerate(points.tolist()):
+        _, surface_normal, _, _ = bvh.find_nearest(co)
+        direction = -np.array(surface_normal) if surface_normal is not None else bisectors[i]
+        direction = direction - normal * direction.dot(normal)
+        if np.linalg.norm(direction) < 1e-6:
+            direction = bisectors[i]
+        directions[i] = direction
+    return directions / np.maximum(np.linalg.norm(directions, axis=1), 1e-12)[:, None]
+
+
+# Share of the inradius of the loop the cap may be inset by, so the offset rings do not cross each other
+INSET_LIMIT = 0.8
+# Candidate centers per side of the grid loop_inradius measures from
+INRADIUS_SAMPLES = 48
+
+
+def loop_inradius(points, normal):
+    """Return the radius of the largest circle inside the loop seen along the normal, measured from a grid of
+    candidate centers over the bounding box of the loop."""
+    helper = np.array([1.0, 0.0, 0.0]) if abs(normal[0]) < 0.9 else np.array([0.0, 1.0, 0.0])
+    u = np.cross(normal, helper)
+    u /= np.linalg.norm(u)
+    flat = np.column_stack((points @ u, points @ np.cross(normal, u)))
+    start, end = flat, np.roll(flat, -1, axis=0)
+    axes = [np.linspace(low, high, INRADIUS_SAMPLES) for low, high in zip(flat.min(axis=0), flat.max(axis=0))]
+    centers = np.stack(np.meshgrid(*axes), axis=-1).reshape(-1, 1, 2)
+
+    # Even-odd rule: a center is inside when a ray along x from it crosses the loop an odd number of times
+    spans = (start[:, 1] > centers[..., 1]) != (end[:, 1] > centers[..., 1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing = start[:, 0] + (centers[..., 1] - start[:, 1]) * (end[:, 0] - start[:, 0]) / (end[:, 1] - start[:, 1])
+    inside = np.count_nonzero(spans & (centers[..., 0] < crossing), axis=1) % 2 == 1
+    if not inside.any():
+        return 0.0
 
+    # Distance from the inside centers to the nearest edge of the loop
+    centers = centers[inside]
+    edges = end - start
+    along = np.einsum("cej,ej->ce", centers - start, edges) / np.maximum(np.einsum("ej,ej->e", edges, edges), 1e-12)
+    closest = start + edges * np.clip(along, 0, 1)[..., None]
+    return float(np.linalg.norm(centers - closest, axis=-1).min(axis=1).max())
+
+
+@profiling.stage("curve_cut: cutter border")
+def chop_obj(cut_line, selected_obj):
+    """Turn the cut line into a thin cutting object: a flat border band of border_thickness following the line,
+    then a band that rises to a flat cap filling the loop. The geometry is built in a single pass, whatever the
+    thickness of the border, with the inset limited by the inradius of the loop where the loop is too narrow for it.
+    The cut line is deleted when it has too few points to make a cutting object."""
+    coordinates = np.empty(len(cut_line.data.vertices) * 3)
+    cut_line.data.vertices.foreach_get("co", coordinates)
+    matrix = np.array(cut_line.matrix_world)
+    points = weld_loop(coordinates.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3], 0.5)
+    count = len(points)
+    if count < 3:
+        mesh_utils.remove_object(cut_line)
+        return None
+
+    # Newell normal of the loop, the face filling it faces this way when the loop turns counterclockwise around it
+    following = np.roll(points, -1, axis=0)
+    normal = np.cross(points, following).sum(axis=0)
+    normal /= max(np.linalg.norm(normal), 1e-12)
+    directions = inward_directions(points, normal, spatial_index.bvh_tree(selected_obj))
+
+    # The border grows by 0.1 for every 0.1 of border_thickness on top of a first 0.1
+    border_width = 0.1 * (round(bpy.context.scene.border_thickness / 0.1) + 1)
+    cap_inset = border_width + 0.5
+    # Narrow loops shrink the whole inset, so the cap stays inside the border
+    scale = min(1.0, INSET_LIMIT * loop_inradius(points, normal) / cap_inset)
+    border = points + directions * border_width * scale
+    cap = points + directions * cap_inset * scale + normal
+    # Flatten the cap onto the plane through its middle
+    cap -= np.outer((cap - cap.mean(axis=0)) @ normal, normal)
+
+    bm = bmesh.new()
+    rings = [[bm.verts.new(co) for co in ring.tolist()] for ring in (points, border, cap)]
+    for outer, inner in zip(rings, rings[1:]):
+        for i in range(count):
+            j = (i + 1) % count
+            bm.faces.new((outer[i], outer[j], inner[j], inner[i]))
+    cap_face = bm.faces.new(rings[2])
+    bmesh.ops.triangulate(bm, faces=[cap_face], quad_method='BEAUTY', ngon_method='BEAUTY')
+    # Weld each offset ring where the inset folds onto itself in the concave parts of the loop, one ring at a time
+    # so the border is never merged into the cap
+    for ring in rings[1:]:
+        bmesh.ops.remove_doubles(bm, verts=[vert for vert in ring if vert.is_valid], dist=0.5)
+
+    #give the cutting object a thickness of 0.01
+    extruded = bmesh.ops.extrude_face_region(bm, geom=bm.faces[:])
+    offset = mathutils.Vector(normal * 0.01)
+    for vert in extruded['geom']:
+        if isinstance(vert, bmesh.types.BMVert):
+            vert.co += offset
+    bmesh.ops.recalc_face_normals(bm, faces=bm.faces)
+
+    mesh = cut_line.data
+    bm.to_mesh(mesh)
+    mesh.update()
+    bm.free()
+    cut_line.matrix_world = mathutils.Matrix.Identity(4)
+    spatial_index.invalidate(cut_line)
+    cut_line.name = "Cut Mesh"
+
+    obj_cuts_collection = bpy.data.collections.get("Cutting objects")
     if not obj_cuts_collection:
         obj_cuts_collection = bpy.data.collections.new("Cutting objects")
         bpy.context.scene.collection.children.link(obj_cuts_collection)  # Add the new collection to the scene
-    
-    obj_cuts_collection = bpy.data.collections.get("Cutting objects")
-    active_object = bpy.context.active_object
-    obj_cuts_collection.objects.link(active_object)  # Link the object to the collection
-    bpy.context.collection.objects.unlink(active_object)  # Unlink the object from the current collection
-    
+    for collection in cut_line.users_collection:
+        collection.objects.unlink(cut_line)
+    obj_cuts_collection.objects.link(cut_line)  # Link the object to the collection
+    return cut_line
+
 
 def chopit(cut_obj, selected_object):
     # Assign boolean modifier to selected object
@@ -196,6 +316,86 @@ def chopit(cut_obj, selected_object):
     bool_mod.operation = 'DIFFERENCE'
     bool_mod.object = cut_obj
     # Delete the "draw cuts" collection if it exists
-    
 
-    
+
+def chopit_collection(cut_collection, selected_object):
+    # A single boolean modifier cutting with every object of the collection at once
+    bool_mod = selected_object.modifiers.new(name="Boolean", type='BOOLEAN')
+    bool_mod.operation = 'DIFFERENCE'
+    bool_mod.operand_type = 'COLLECTION'
+    bool_mod.collection = cut_collection
+    bool_mod.solver = 'EXACT'
+
+
+# Custom property naming the object a part was chopped from, shared by all the parts of that object
+PART_GROUP_PROPERTY = "chopit_group"
+
+
+def part_group(selected_object):
+    """Return the parts chopped from the same object as the selected object, or just the object if it was never chopped."""
+    group = selected_object.get(PART_GROUP_PROPERTY)
+    if group is None:
+        return [selected_object]
+    return [obj for obj in bpy.context.scene.objects if obj.type == 'MESH' and obj.get(PART_GROUP_PROPERTY) == group]
+
+
+def bounds_overlap(obj, other):
+    low, high = mesh_utils.world_bounds(obj)
+    other_low, other_high = mesh_utils.world_bounds(other)
+    return all(low[i] <= other_high[i] and other_low[i] <= high[i] for i in range(3))
+
+
+def changed_parts(parts, cut_objs):
+    """Return the parts chop_parts_steps modifies: those whose bounding box overlaps the bounding box of at least one
+    cutting object, and those never chopped, which are split into their loose parts even when no cut reaches them."""
+    return [
+        part for part in parts
+        if PART_GROUP_PROPERTY not in part or any(bounds_overlap(part, cut_obj) for cut_obj in cut_objs)
+    ]
+
+
+def chop_mesh(selected_object, cut_objs, cut_collection=None):
+    """Cut the object with every cutting object and return its loose parts, without operators.
+    With cut_collection, the object goes through a single Boolean with all the objects of the collection instead."""
+    return jobs.run(chop_mesh_steps(selected_object, cut_objs, cut_collection))
+
+
+def chop_mesh_steps(selected_object, cut_objs, cut_collection=None):
+    """Job generator of chop_mesh (see jobs.py), returning the parts."""
+    return (yield from chop_parts_steps([selected_object], cut_objs, cut_collection))
+
+
+def chop_parts_steps(parts, cut_objs, cut_collection=None):
+    """Job generator cutting every part with the cutting objects overlapping it, returning the loose parts of all the
+    parts, tagged as one group. All the parts go through the Boolean solver in a single depsgraph evaluation, the parts
+    of an earlier chop no cut reaches are left as they are."""
+    group = parts[0].get(PART_GROUP_PROPERTY, parts[0].name) if parts else None
+    changed = set(changed_parts(parts, cut_objs))
+    kept_parts = [part for part in parts if part not in changed]
+    cut_parts = []
+    separated_parts = []
+    for part in parts:
+        if part not in changed:
+            continue
+        mesh_utils.apply_transform(part)
+        separated_parts.append(part)
+        overlapping = [cut_obj for cut_obj in cut_objs if bounds_overlap(part, cut_obj)]
+        if not overlapping:
+            continue
+        if cut_collection:
+            chopit_collection(cut_collection, part)
+        else:
+            for cut_obj in overlapping:
+                chopit(cut_obj, part)
+        cut_parts.append(part)
+    yield 0.1
+    with profiling.stage("chopit: boolean"):
+        mesh_utils.apply_modifiers(cut_parts)
+    yield 0.8
+    new_parts = []
+    with profiling.stage("chopit: separate parts"):
+        for part in separated_parts:
+            new_parts.extend(mesh_utils.separate_loose(part))
+    for part in new_parts:
+        part[PART_GROUP_PROPERTY] = group
+    return kept_parts + new_parts
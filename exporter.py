@@ -0,0 +1,293 @@
+"""Export of mesh objects to binary STL or 3MF without going through the export operators.
+The triangles are read from the evaluated meshes on the main thread and written to disk on a thread pool.
+Bundles stream all the parts into a single archive as they are read, a zip of STL files or a multi-object 3MF."""
+import bpy
+import hashlib
+import io
+import json
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import profiling
+
+# File in the export folder remembering the content hash of every file written there
+MANIFEST_NAME = ".chopchop_export.json"
+# ChopChop sets the scene to centimeters, one Blender unit is one centimeter
+MODEL_UNIT = "centimeter"
+STL_TRIANGLE = np.dtype([("normal", "<f4", 3), ("vertices", "<f4", (3, 3)), ("attribute", "<u2")])
+
+CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>
+</Types>
+"""
+RELATIONSHIPS = """<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Target="/3D/3dmodel.model" Id="rel0" Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>
+</Relationships>
+"""
+
+
+@profiling.stage("export: read triangles")
+def mesh_triangles(obj, depsgraph):
+    """Return the (vertices, triangles) arrays of the evaluated object, with the vertices in world coordinates."""
+    evaluated = obj.evaluated_get(depsgraph)
+    mesh = evaluated.to_mesh()
+    mesh.calc_loop_triangles()
+    vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", vertices)
+    triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("vertices", triangles)
+    evaluated.to_mesh_clear()
+
+    matrix = np.array(obj.matrix_world, dtype=np.float64)
+    vertices = vertices.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+    return vertices.astype(np.float32), triangles.reshape(-1, 3)
+
+
+def write_stl(path, name, vertices, triangles):
+    """Write the triangles to a binary STL file."""
+    with open(path, "wb") as stl_file:
+        write_stl_data(stl_file, name, vertices, triangles)
+
+
+def write_stl_data(stl_file, name, vertices, triangles):
+    """Write the triangles in binary STL to an open file."""
+    data = np.zeros(len(triangles), dtype=STL_TRIANGLE)
+    corners = vertices[triangles]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    data["normal"] = normals / np.where(lengths > 0, lengths, 1)[:, None]
+    data["vertices"] = corners
+    header = name.encode("utf-8", "replace")[:80].ljust(80, b" ")
+    stl_file.write(header)
+    stl_file.write(np.uint32(len(triangles)).tobytes())
+    stl_file.write(data.tobytes())
+
+
+def model_object_xml(object_id, name, vertices, triangles):
+    """Return the <object> element of a mesh in a 3MF model."""
+    vertex_text = io.StringIO()
+    np.savetxt(vertex_text, vertices, fmt='<vertex x="%.6g" y="%.6g" z="%.6g"/>')
+    triangle_text = io.StringIO()
+    np.savetxt(triangle_text, triangles, fmt='<triangle v1="%d" v2="%d" v3="%d"/>')
+    name = name.replace("&", "&amp;").replace('"', "&quot;").replace("<", "&lt;")
+    return (
+        f'<object id="{object_id}" name="{name}" type="model"><mesh>\n'
+        f'<vertices>\n{vertex_text.getvalue()}</vertices>\n'
+        f'<triangles>\n{triangle_text.getvalue()}</triangles>\n'
+        '</mesh></object>\n'
+    )
+
+
+MODEL_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    f'<model unit="{MODEL_UNIT}" xml:lang="en-US" xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">\n'
+    '<resources>\n'
+)
+
+
+def model_footer(count):
+    items = "".join(f'<item objectid="{i + 1}"/>' for i in range(count))
+    return f'</resources>\n<build>{items}</build>\n</model>\n'
+
+
+def write_3mf(path, meshes):
+    """Write (name, vertices, triangles) meshes as the objects of a single 3MF file."""
+    objects = "".join(model_object_xml(i + 1, *mesh) for i, mesh in enumerate(meshes))
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", CONTENT_TYPES)
+        archive.writestr("_rels/.rels", RELATIONSHIPS)
+        archive.writestr("3D/3dmodel.model", MODEL_HEADER + objects + model_footer(len(meshes)))
+
+
+def part_summary(name, file_name, vertices, triangles):
+    """Return the manifest entry of a part: its file, bounds, enclosed volume and triangle count."""
+    corners = vertices[triangles].astype(np.float64)
+    volume = np.einsum("ij,ij->i", corners[:, 0], np.cross(corners[:, 1], corners[:, 2])).sum() / 6
+    return {
+        "name": name,
+        "file": file_name,
+        "bounds": [vertices.min(axis=0).tolist(), vertices.max(axis=0).tolist()] if len(vertices) else None,
+        "volume": abs(float(volume)),
+        "triangles": len(triangles),
+    }
+
+
+class StlZipWriter:
+    """Zip archive of binary STL files with a manifest.json describing the parts."""
+
+    def __init__(self, path):
+        self.archive = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, allowZip64=True)
+        self.manifest = []
+
+    def add(self, name, vertices, triangles):
+        if not len(triangles):
+            return
+        file_name = f"{name}.stl"
+        with self.archive.open(file_name, "w", force_zip64=True) as stl_file:
+            write_stl_data(stl_file, name, vertices, triangles)
+        self.manifest.append(part_summary(name, file_name, vertices, triangles))
+
+    def close(self):
+        self.archive.writestr("manifest.json", json.dumps({"unit": MODEL_UNIT, "parts": self.manifest}, indent=2))
+        self.archive.close()
+
+
+class ThreeMfWriter:
+    """3MF file with one object per part, the model is compressed as the objects are added."""
+
+    def __init__(self, path):
+        self.archive = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, allowZip64=True)
+        self.archive.writestr("[Content_Types].xml", CONTENT_TYPES)
+        self.archive.writestr("_rels/.rels", RELATIONSHIPS)
+        self.model = io.TextIOWrapper(self.archive.open("3D/3dmodel.model", "w", force_zip64=True), encoding="utf-8")
+        self.model.write(MODEL_HEADER)
+        self.count = 0
+
+    def add(self, name, vertices, triangles):
+        # 3MF objects need at least one triangle, slicers reject the whole file otherwise
+        if not len(triangles):
+            return
+        self.count += 1
+        self.model.write(model_object_xml(self.count, name, vertices, triangles))
+
+    def close(self):
+        self.model.write(model_footer(self.count))
+        self.model.close()
+        self.archive.close()
+
+
+BUNDLE_WRITERS = {'STL_ZIP': (StlZipWriter, "zip"), '3MF_BUNDLE': (ThreeMfWriter, "3mf")}
+
+
+@profiling.stage("export: hash")
+def content_hash(obj, depsgraph):
+    """Return a hash of the object's evaluated geometry and world matrix."""
+    digest = hashlib.blake2b(digest_size=16)
+    # The mesh is only evaluated when modifiers or shape keys change it, it is hashed directly otherwise
+    evaluated = obj.evaluated_get(depsgraph) if obj.modifiers or obj.data.shape_keys else None
+    mesh = evaluated.to_mesh() if evaluated else obj.data
+    for collection, attribute, size, dtype in (
+        (mesh.vertices, "co", 3, np.float32),
+        (mesh.loops, "vertex_index", 1, np.int32),
+        (mesh.polygons, "loop_total", 1, np.int32),
+    ):
+        values = np.empty(len(collection) * size, dtype=dtype)
+        collection.foreach_get(attribute, values)
+        digest.update(values.tobytes())
+    if evaluated:
+        evaluated.to_mesh_clear()
+    digest.update(np.array(obj.matrix_world, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+class ExportManifest:
+    """Content hashes of the files in an export folder, to skip the objects that have not changed since their file
+    was written."""
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        try:
+            with open(self.path) as manifest_file:
+                self.files = json.load(manifest_file)
+        except (OSError, ValueError):
+            self.files = {}
+
+    def is_current(self, path, digest):
+        return self.files.get(os.path.basename(path)) == digest and os.path.exists(path)
+
+    def record(self, path, digest):
+        self.files[os.path.basename(path)] = digest
+
+    def forget(self, path):
+        """Drop the hash of a file about to be written, so a failed write is never taken for an up to date file."""
+        self.files.pop(os.path.basename(path), None)
+
+    def save(self):
+        with open(self.path, "w") as manifest_file:
+            json.dump(self.files, manifest_file, indent=1)
+
+
+def export_bundle(objects, path, file_format, manifest=None):
+    """Stream every object into a single archive at path. A single thread writes the archive, one part at a time,
+    while the next part is read, so at most two parts are held in memory. Objects without triangles are left out.
+    With a manifest, the archive is not written again when none of the objects changed, and its hash is recorded once
+    it has been written. Return whether it was written."""
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    if manifest:
+        digest = hashlib.blake2b(digest_size=16)
+        for obj in objects:
+            digest.update(f"{obj.name}:{content_hash(obj, depsgraph)};".encode())
+        if manifest.is_current(path, digest.hexdigest()):
+            return False
+        manifest.forget(path)
+    writer = BUNDLE_WRITERS[file_format][0](path)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pending = None
+        try:
+            for obj in objects:
+                vertices, triangles = mesh_triangles(obj, depsgraph)
+                if pending:
+                    pending.result()
+                pending = pool.submit(writer.add, obj.name, vertices, triangles)
+            with profiling.stage("export: wait for writes"):
+                if pending:
+                    pending.result()
+        finally:
+            pool.submit(writer.close).result()
+    if manifest:
+        manifest.record(path, digest.hexdigest())
+    return True
+
+
+def bundle_path(folder, file_format):
+    """Return the path of the archive of a bundled export, named after the blend file."""
+    name = bpy.path.display_name_from_filepath(bpy.data.filepath) or "parts"
+    return os.path.join(folder, f"{name}.{BUNDLE_WRITERS[file_format][1]}")
+
+
+def changed_objects(objects, folder, extension, manifest):
+    """Return (object, path, hash) for the objects whose file in the folder is missing or out of date. Their old hashes
+    are dropped from the manifest, the caller records the new ones once the files are written."""
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    changed = []
+    for obj in objects:
+        path = os.path.join(folder, f"{obj.name}.{extension}")
+        digest = content_hash(obj, depsgraph)
+        if not manifest.is_current(path, digest):
+            manifest.forget(path)
+            changed.append((obj, path, digest))
+    return changed
+
+
+def export_objects(objects, folder, file_format='STL', workers=None, manifest=None):
+    """Export every object to its own file in the folder and return the paths written.
+    Reading the meshes has to happen on the main thread, the files are written on a thread pool meanwhile.
+    Objects without triangles are skipped. With a manifest, the objects whose file is up to date are skipped too and
+    the hash of every file is recorded once the file has been written."""
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    writer = write_stl if file_format == 'STL' else lambda path, *mesh: write_3mf(path, [mesh])
+    extension = file_format.lower()
+    if manifest:
+        targets = changed_objects(objects, folder, extension, manifest)
+    else:
+        targets = [(obj, os.path.join(folder, f"{obj.name}.{extension}"), None) for obj in objects]
+    paths = []
+    with ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1)) as pool:
+        futures = []
+        for obj, path, digest in targets:
+            vertices, triangles = mesh_triangles(obj, depsgraph)
+            if not len(triangles):
+                # Nothing to print, like an empty part left by a cut
+                continue
+            futures.append((path, digest, pool.submit(writer, path, obj.name, vertices, triangles)))
+            paths.append(path)
+        with profiling.stage("export: wait for writes"):
+            for path, digest, future in futures:
+                future.result()
+                if manifest:
+                    manifest.record(path, digest)
+    return paths
@@ -0,0 +1,181 @@
+"""Fast import of binary STL and PLY files. The file is memory mapped and read as NumPy arrays in place, and the mesh
+is built with bulk foreach_set calls. Files these readers do not handle (ASCII variants) return None, for the
+caller to fall back to Blender's importers."""
+import bpy
+import os
+import struct
+import numpy as np
+import exporter
+import mesh_utils
+import profiling
+
+PLY_TYPES = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4", "double": "f8", "float64": "f8",
+}
+
+
+def weld(vertices):
+    """Merge the vertices with exactly the same coordinates, return (unique vertices, index of every input vertex)."""
+    rows = np.ascontiguousarray(vertices, dtype=np.float32)
+    keys = rows.view(np.dtype((np.void, rows.dtype.itemsize * 3))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return rows[first], inverse.ravel().astype(np.int32)
+
+
+@profiling.stage("import: read stl")
+def read_stl(path):
+    """Return the (vertices, faces) arrays of a binary STL file, or None if it is not one."""
+    # np.memmap can not map an empty file
+    if os.path.getsize(path) < 84:
+        return None
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    count = int(data[80:84].view("<u4")[0])
+    if len(data) != 84 + count * exporter.STL_TRIANGLE.itemsize:
+        return None
+    records = np.frombuffer(data, dtype=exporter.STL_TRIANGLE, count=count, offset=84)
+    vertices, indices = weld(records["vertices"].reshape(-1, 3))
+    return vertices, indices.reshape(-1, 3)
+
+
+def read_ply_header(data):
+    """Return (byte order, elements, header size) of a PLY file, elements being [name, count, [(property, type)]]
+    with list properties typed as ("list", count type, item type)."""
+    end = bytes(data[:65536]).find(b"end_header")
+    if end < 0:
+        return None
+    header_size = bytes(data[:end + 12]).index(b"\n", end) + 1
+    lines = bytes(data[:header_size]).decode("ascii", "replace").splitlines()
+    if not lines or lines[0].strip() != "ply":
+        return None
+    byte_order = None
+    elements = []
+    for line in lines[1:]:
+        words = line.split()
+        if not words:
+            continue
+        if words[0] == "format":
+            byte_order = {"binary_little_endian": "<", "binary_big_endian": ">"}.get(words[1])
+        elif words[0] == "element":
+            elements.append([words[1], int(words[2]), []])
+        elif words[0] == "property" and elements:
+            if words[1] == "list":
+                elements[-1][2].append((words[4], ("list", PLY_TYPES[words[2]], PLY_TYPES[words[3]])))
+            else:
+                elements[-1][2].append((words[2], PLY_TYPES[words[1]]))
+    return byte_order, elements, header_size
+
+
+def ply_faces(data, offset, count, properties, byte_order):
+    """Return the faces of a PLY face element as a (faces, corners) index array, or (starts, indices) flat arrays
+    when the faces do not all have the same number of corners, and the offset after the element."""
+    lists = [name for name, kind in properties if isinstance(kind, tuple)]
+    if not lists:
+        return None, offset
+    list_name = "vertex_indices" if "vertex_indices" in lists else lists[0]
+    if count == 0:
+        return np.empty((0, 3), dtype=np.int32), offset
+
+    # Assume every face has the same layout as the first one, and check it
+    fields = []
+    sizes = {}
+    position = offset
+    for name, kind in properties:
+        if isinstance(kind, tuple):
+            _, count_type, item_type = kind
+            size = int(np.frombuffer(data, dtype=byte_order + count_type, count=1, offset=position)[0])
+            fields.append((name + "_count", byte_order + count_type))
+            fields.append((name, byte_order + item_type, (size,)))
+            sizes[name] = size
+            position += np.dtype(count_type).itemsize + size * np.dtype(item_type).itemsize
+        else:
+            fields.append((name, byte_order + kind))
+            position += np.dtype(kind).itemsize
+    face_dtype = np.dtype(fields)
+    if len(data) >= offset + count * face_dtype.itemsize:
+        records = np.frombuffer(data, dtype=face_dtype, count=count, offset=offset)
+        if all(np.all(records[name + "_count"] == size) for name, size in sizes.items()):
+            return records[list_name].astype(np.int32), offset + count * face_dtype.itemsize
+
+    # Mixed polygons: every face starts where the lists of the face before end, so the list sizes are scanned one
+    # face at a time, then the indices of all the faces are gathered at once from their sizes
+    steps = []
+    for name, kind in properties:
+        if isinstance(kind, tuple):
+            _, count_type, item_type = kind
+            counter = struct.Struct(byte_order + np.dtype(count_type).char)
+            steps.append((name == list_name, counter, np.dtype(item_type).itemsize))
+            if name == list_name:
+                index_type = np.dtype(byte_order + item_type)
+        else:
+            steps.append((False, None, np.dtype(kind).itemsize))
+    sizes = np.empty(count, dtype=np.int64)
+    # Byte offset of the first index of every face
+    firsts = np.empty(count, dtype=np.int64)
+    for i in range(count):
+        for is_index_list, counter, item_size in steps:
+            if counter is None:
+                offset += item_size
+                continue
+            size = counter.unpack_from(data, offset)[0]
+            offset += counter.size
+            if is_index_list:
+                sizes[i] = size
+                firsts[i] = offset
+            offset += size * item_size
+
+    starts = np.cumsum(sizes) - sizes
+    item_size = index_type.itemsize
+    positions = np.repeat(firsts - starts * item_size, sizes) + np.arange(int(sizes.sum())) * item_size
+    indices = np.asarray(data)[positions[:, None] + np.arange(item_size)].view(index_type).ravel()
+    return (starts.astype(np.int32), indices.astype(np.int32)), offset
+
+
+@profiling.stage("import: read ply")
+def read_ply(path):
+    """Return the (vertices, faces) arrays of a binary PLY file, or None if it is not one."""
+    if os.path.getsize(path) == 0:
+        return None
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    header = read_ply_header(data)
+    if header is None or header[0] is None:
+        return None
+    byte_order, elements, offset = header
+
+    vertices = faces = None
+    for name, count, properties in elements:
+        if name == "face":
+            faces, offset = ply_faces(data, offset, count, properties, byte_order)
+            continue
+        if any(isinstance(kind, tuple) for _, kind in properties):
+            # Only the vertex and face elements matter, other list elements end the readable part
+            break
+        element_dtype = np.dtype([(prop, byte_order + kind) for prop, kind in properties])
+        if name == "vertex":
+            records = np.frombuffer(data, dtype=element_dtype, count=count, offset=offset)
+            vertices = np.column_stack((records["x"], records["y"], records["z"])).astype(np.float32)
+        offset += count * element_dtype.itemsize
+    if vertices is None or faces is None:
+        return None
+    return vertices, faces
+
+
+def import_mesh(path, collection):
+    """Import a binary STL or PLY file as a new object in the collection, or return None if the file can't be read."""
+    extension = os.path.splitext(path)[1].lower()
+    reader = {".stl": read_stl, ".ply": read_ply}.get(extension)
+    try:
+        arrays = reader(path) if reader else None
+    except (ValueError, KeyError, IndexError):
+        # Truncated or malformed files are left to Blender's importers, which report what is wrong with them
+        arrays = None
+    if arrays is None:
+        return None
+    name = bpy.path.display_name_from_filepath(path)
+    with profiling.stage("import: build mesh"):
+        mesh = mesh_utils.new_mesh(name, *arrays)
+    obj = bpy.data.objects.new(name, mesh)
+    collection.objects.link(obj)
+    return obj
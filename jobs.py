@@ -0,0 +1,224 @@
+"""Timer driven jobs for the long operators, so Blender stays responsive while they run.
+A job is a generator yielding the fraction of the work done after each step. The ModalJob operators run the
+steps from a timer, show the progress in the ChopChop panel and roll everything back when Esc is pressed."""
+import bpy
+import time
+import profiling
+
+# Seconds of work done on every timer event before handing control back to Blender
+TIME_SLICE = 0.1
+TIMER_INTERVAL = 0.01
+# Events still handled by Blender while a job runs, to look around the scene. Everything else (editing, undo,
+# deleting, starting another operator) is blocked, the job holds references to the data it works on
+NAVIGATION_EVENTS = {
+    'MOUSEMOVE', 'INBETWEEN_MOUSEMOVE', 'MIDDLEMOUSE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE',
+    'TRACKPADPAN', 'TRACKPADZOOM', 'MOUSEROTATE', 'MOUSESMARTZOOM', 'WINDOW_DEACTIVATE',
+}
+
+# Label of the job running in the background, None when there is none
+running_job = None
+
+
+def run(steps):
+    """Run all the steps of a job at once and return its result."""
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+
+class JobSnapshot:
+    """Remember the state of the blend data when a job starts, to undo what the job did if it is cancelled."""
+
+    def __init__(self):
+        self.objects = {obj.session_uid for obj in bpy.data.objects}
+        self.collections = {collection.session_uid for collection in bpy.data.collections}
+        self.meshes = {mesh.session_uid for mesh in bpy.data.meshes}
+        self.backups = {}
+
+    def backup(self, obj):
+        """Keep a copy of an existing object's mesh, transform, modifiers and visibility before the job changes it."""
+        if obj.session_uid not in self.backups:
+            modifiers = {modifier.name for modifier in obj.modifiers}
+            self.backups[obj.session_uid] = (
+                obj.name, obj.data.copy(), obj.matrix_world.copy(), obj.hide_viewport, obj.hide_get(), modifiers
+            )
+
+    def restore(self):
+        """Delete everything the job created and put the backed up objects back as they were."""
+        for obj in list(bpy.data.objects):
+            if obj.session_uid not in self.objects:
+                bpy.data.objects.remove(obj)
+        for collection in list(bpy.data.collections):
+            if collection.session_uid not in self.collections:
+                bpy.data.collections.remove(collection)
+
+        for uid, (name, mesh, matrix, hidden, hidden_in_view_layer, modifiers) in self.backups.items():
+            obj = bpy.data.objects.get(name)
+            if obj is None or obj.session_uid != uid:
+                obj = next((obj for obj in bpy.data.objects if obj.session_uid == uid), None)
+            if obj is None:
+                continue
+            changed_mesh = obj.data
+            obj.data = mesh
+            if changed_mesh.users == 0:
+                mesh_name = changed_mesh.name
+                bpy.data.meshes.remove(changed_mesh)
+                mesh.name = mesh_name
+            obj.matrix_world = matrix
+            obj.hide_viewport = hidden
+            if obj.name in bpy.context.view_layer.objects:
+                obj.hide_set(hidden_in_view_layer)
+            for modifier in list(obj.modifiers):
+                if modifier.name not in modifiers:
+                    obj.modifiers.remove(modifier)
+        self.backups.clear()
+
+        for mesh in list(bpy.data.meshes):
+            if mesh.session_uid not in self.meshes and mesh.users == 0:
+                bpy.data.meshes.remove(mesh)
+
+    def discard(self):
+        """Drop the backups once the job is done."""
+        for _, mesh, _, _, _, _ in self.backups.values():
+            if mesh.users == 0:
+                bpy.data.meshes.remove(mesh)
+        self.backups.clear()
+
+
+def tag_redraw(context):
+    if context.screen:
+        for area in context.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+
+class ModalJob:
+    """Mixin for operators split into steps. Subclasses implement steps(context) and can call
+    self.snapshot.backup(obj) before changing an object that existed before the job. Only one job runs at a time."""
+    job_label = "Working"
+
+    def steps(self, context):
+        """Return the job generator of the operator. It yields the fraction of the work done after every step,
+        between 0 and 1, and raises to fail the job. It is closed when the job is cancelled between two steps,
+        so whatever it must release (bmeshes, processes) goes in try/finally blocks."""
+        raise NotImplementedError(f"{type(self).__name__} does not define the steps of its job")
+
+    def refuse_second_job(self):
+        if running_job is None:
+            return False
+        self.report({'WARNING'}, f"Wait for {running_job} to finish or press Esc to cancel it")
+        return True
+
+    def execute(self, context):
+        if self.refuse_second_job():
+            return {'CANCELLED'}
+        # Without a window to run a timer in (scripts, background mode) all the steps run at once
+        self.snapshot = JobSnapshot()
+        profiling.begin(context.scene.chopchop_profiling)
+        try:
+            run(self.steps(context))
+        except Exception as error:
+            self.snapshot.restore()
+            self.report({'ERROR'}, f"{self.job_label} failed: {error}")
+            return {'CANCELLED'}
+        finally:
+            profiling.end(self.bl_label, context.scene.chopchop_profile_file)
+        self.snapshot.discard()
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        global running_job
+        if self.refuse_second_job():
+            return {'CANCELLED'}
+        running_job = self.job_label
+        self.snapshot = JobSnapshot()
+        # The steps run during later events, when this context is gone, so they get the global one
+        self.job = self.steps(bpy.context)
+        self.start_time = time.perf_counter()
+        profiling.begin(context.scene.chopchop_profiling)
+
+        wm = context.window_manager
+        wm.chopchop_job = self.job_label
+        wm.chopchop_progress = 0.0
+        wm.chopchop_eta = ""
+        wm.progress_begin(0.0, 1.0)
+        self.timer = wm.event_timer_add(TIMER_INTERVAL, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.job.close()
+            self.snapshot.restore()
+            self.end(context)
+            self.report({'WARNING'}, f"{self.job_label} cancelled")
+            return {'CANCELLED'}
+        if event.type != 'TIMER':
+            # Other timers and navigation go on, the rest is swallowed
+            if event.type in NAVIGATION_EVENTS or event.type.startswith(('NDOF_', 'TIMER')):
+                return {'PASS_THROUGH'}
+            return {'RUNNING_MODAL'}
+
+        deadline = time.perf_counter() + TIME_SLICE
+        try:
+            while time.perf_counter() < deadline:
+                self.update_progress(context, next(self.job))
+        except StopIteration:
+            self.snapshot.discard()
+            self.end(context)
+            return {'FINISHED'}
+        except Exception as error:
+            self.snapshot.restore()
+            self.end(context)
+            self.report({'ERROR'}, f"{self.job_label} failed: {error}")
+            return {'CANCELLED'}
+        return {'RUNNING_MODAL'}
+
+    def update_progress(self, context, progress):
+        wm = context.window_manager
+        wm.chopchop_progress = progress
+        wm.progress_update(progress)
+        if progress > 0:
+            elapsed = time.perf_counter() - self.start_time
+            wm.chopchop_eta = f"{elapsed / progress * (1 - progress):.0f} s left"
+        tag_redraw(context)
+
+    def end(self, context):
+        global running_job
+        running_job = None
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+        wm.chopchop_job = ""
+        profiling.end(self.bl_label, context.scene.chopchop_profile_file)
+        tag_redraw(context)
+
+
+@bpy.app.handlers.persistent
+def on_load(*args):
+    # Loading a file ends the modal handlers without calling them
+    global running_job
+    if running_job:
+        profiling.end(running_job)
+    running_job = None
+
+
+def register():
+    bpy.app.handlers.load_post.append(on_load)
+    bpy.types.WindowManager.chopchop_job = bpy.props.StringProperty()
+    bpy.types.WindowManager.chopchop_progress = bpy.props.FloatProperty(
+        name="Progress",
+        subtype='FACTOR',
+        min=0.0,
+        max=1.0,
+    )
+    bpy.types.WindowManager.chopchop_eta = bpy.props.StringProperty()
+
+
+def unregister():
+    bpy.app.handlers.load_post.remove(on_load)
+    del bpy.types.WindowManager.chopchop_job
+    del bpy.types.WindowManager.chopchop_progress
+    del bpy.types.WindowManager.chopchop_eta
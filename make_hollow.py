@@ -1,101 +1,384 @@
 import bpy
+import bmesh
+import math
+import numpy as np
+from mathutils import Vector
+import jobs
+import mesh_utils
+import profiling
+import spatial_index
 
-def make_hollow_part(obj, thickness):
-    bpy.context.view_layer.objects.active = obj
-    bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
-    #Make a copy of the mesh
-    bpy.ops.object.duplicate()
-    #store the copy in a variable
-    core = bpy.context.selected_objects[0]
-    #rename the copy
-    core.name = "Core"
-    #make a second copy
-    bpy.ops.object.duplicate()
-    #store the second copy in a variable
-    limit = bpy.context.selected_objects[0]
-    #rename the second copy
-    limit.name = "Limit"
-    #deselect everything
-    bpy.ops.object.select_all(action='DESELECT')
-    #select the core
-    bpy.context.view_layer.objects.active = core
-    #Enter edit mode
-    bpy.ops.object.mode_set(mode='EDIT')
-    #change to vertex select mode
-    bpy.ops.mesh.select_mode(type="VERT")
-    #Select all the vertices
-    bpy.ops.mesh.select_all(action='SELECT')
-
-    for x in range(10):
-        bpy.ops.transform.shrink_fatten(value=-thickness/10)
-        bpy.ops.mesh.remove_doubles(threshold=thickness/(10-x))
-        bpy.ops.mesh.vertices_smooth(factor=0.5)
-
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.object.modifier_add(type='REMESH')
-    bpy.context.object.modifiers["Remesh"].voxel_size = 1
-    bpy.ops.object.modifier_apply(modifier="Remesh")
-
-    bpy.ops.object.select_all(action='DESELECT')
-    #now we select the limit
-    bpy.context.view_layer.objects.active = limit
-    #add decimate modifier and reduce to 0.5
-    bpy.ops.object.modifier_add(type='DECIMATE')
-    bpy.context.object.modifiers["Decimate"].ratio = 0.5
-    #apply the modifier
-    bpy.ops.object.modifier_apply(modifier="Decimate")
-    #Enter edit mode
-    bpy.ops.object.mode_set(mode='EDIT')
-    #change to vertex select mode
-    bpy.ops.mesh.select_mode(type="VERT")
-    #Select all the vertices
-    bpy.ops.mesh.select_all(action='SELECT')
-    #shrink the mesh by the thickness
-    bpy.ops.transform.shrink_fatten(value=-thickness)
-    #deselect everything
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.object.modifier_add(type='REMESH')
-    bpy.context.object.modifiers["Remesh"].voxel_size = 1
-    bpy.ops.object.modifier_apply(modifier="Remesh")
-    bpy.ops.object.select_all(action='DESELECT')
-    #select the core
-    
-    bpy.context.view_layer.objects.active = core
-    #add a boolean modifier to the core and then intercect it with the limit
-    bpy.ops.object.modifier_add(type='BOOLEAN')
-    bpy.context.object.modifiers["Boolean"].operation = 'INTERSECT'
-    bpy.context.object.modifiers["Boolean"].object = limit
-    #use fast solver for the boolean operation 
-    bpy.context.object.modifiers["Boolean"].solver = 'FAST'
-    #apply the modifier
-    bpy.ops.object.modifier_apply(modifier="Boolean")
-    #deselect everything
-    bpy.ops.object.select_all(action='DESELECT')
-    bpy.context.view_layer.objects.active = core
-    #Enter edit mode
-    bpy.ops.object.mode_set(mode='EDIT')
-    #change to vertex select mode
-    bpy.ops.mesh.select_mode(type="VERT")
-    #Select all the vertices
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.vertices_smooth(factor=0.5)
-    bpy.ops.mesh.flip_normals()
-    bpy.ops.object.mode_set(mode='OBJECT')
-    limit.select_set(True)
-    #select the limit
-    bpy.context.view_layer.objects.active = limit
-    #delete the limit
-    bpy.ops.object.delete()
-    #select the core and the original object and join them
-    bpy.ops.object.select_all(action='DESELECT')
-    core.select_set(True)
-    obj.select_set(True)
-    bpy.context.view_layer.objects.active = obj
-    bpy.ops.object.join()
 
+def shrink_fatten(bm, value):
+    """Move every vertex along its normal, like transform.shrink_fatten."""
+    bm.normal_update()
+    for vert in bm.verts:
+        vert.co += vert.normal * value
 
 
+def smooth(bm, factor):
+    """Smooth every vertex, like mesh.vertices_smooth."""
+    bmesh.ops.smooth_vert(bm, verts=bm.verts, factor=factor, use_axis_x=True, use_axis_y=True, use_axis_z=True)
 
 
+def add_remesh(obj):
+    remesh_modifier = obj.modifiers.new(name="Remesh", type='REMESH')
+    remesh_modifier.mode = 'VOXEL'
+    remesh_modifier.voxel_size = 1
 
 
+def make_hollow_part(obj, thickness, engine='MESH'):
+    if engine == 'VOXEL':
+        return jobs.run(make_hollow_voxel_steps(obj, thickness))
+    return jobs.run(make_hollow_steps(obj, thickness))
+
+
+def make_hollow_steps(obj, thickness):
+    """Job generator of make_hollow_part (see jobs.py), returning the object."""
+    mesh_utils.apply_transform(obj)
+    #Make two copies of the mesh
+    core = mesh_utils.duplicate_object(obj, "Core")
+    limit = mesh_utils.duplicate_object(obj, "Limit")
+
+    #shrink the core in 10 steps, merging and smoothing the vertices that come together
+    bm = bmesh.new()
+    bm.from_mesh(core.data)
+    # The bmesh is freed even when the job is cancelled between two steps
+    try:
+        for x in range(10):
+            with profiling.stage("make_hollow: shrink core"):
+                shrink_fatten(bm, -thickness/10)
+                bmesh.ops.remove_doubles(bm, verts=bm.verts, dist=thickness/(10-x))
+                smooth(bm, 0.5)
+            yield 0.4 * (x + 1) / 10
+        bm.to_mesh(core.data)
+    finally:
+        bm.free()
+
+    #reduce the limit to half its faces
+    decimate_modifier = limit.modifiers.new(name="Decimate", type='DECIMATE')
+    decimate_modifier.ratio = 0.5
+    with profiling.stage("make_hollow: decimate limit"):
+        mesh_utils.apply_modifiers([limit])
+    yield 0.5
+    #shrink the limit by the thickness
+    bm = bmesh.new()
+    bm.from_mesh(limit.data)
+    shrink_fatten(bm, -thickness)
+    bm.to_mesh(limit.data)
+    bm.free()
+
+    #remesh both copies and intersect the core with the limit, the Boolean uses the remeshed limit
+    add_remesh(limit)
+    add_remesh(core)
+    boolean_modifier = core.modifiers.new(name="Boolean", type='BOOLEAN')
+    boolean_modifier.operation = 'INTERSECT'
+    boolean_modifier.object = limit
+    #use fast solver for the boolean operation
+    boolean_modifier.solver = 'FAST'
+    with profiling.stage("make_hollow: remesh and intersect"):
+        mesh_utils.apply_modifiers([core])
+    mesh_utils.remove_object(limit)
+    yield 0.9
+
+    #smooth the core and turn it inside out so it becomes the inner wall
+    bm = bmesh.new()
+    bm.from_mesh(core.data)
+    smooth(bm, 0.5)
+    bmesh.ops.reverse_faces(bm, faces=bm.faces)
+    bm.to_mesh(core.data)
+    bm.free()
+
+    #join the core to the original object
+    with profiling.stage("make_hollow: join"):
+        mesh_utils.join_meshes(obj, [core])
+    return obj
+
+
+# Voxel engine: the wall is cut out of a distance field of the object sampled on a grid
+VOXEL_MEMORY_BUDGET = 512 * 2**20
+# Rough bytes used per voxel by the grids of the voxel engine
+VOXEL_BYTES = 16
+# Rough bytes per triangle of the mesh arrays and of the per triangle arrays of the inside test
+TRIANGLE_BYTES = 160
+# Rough bytes of the temporaries of the inside test per triangle and column pair
+INSIDE_PAIR_BYTES = 240
+# Rough bytes per voxel of the exact distance band, and per grid edge crossed by the core surface
+BAND_VOXEL_BYTES = 128
+SURFACE_EDGE_BYTES = 320
+# Voxel layers of the exact distance band once grown, and grid edges crossed by the surface per voxel of its area
+BAND_LAYERS = 5
+EDGES_PER_SURFACE_VOXEL = 2
+# Bounds of the triangle and column pairs tested at once by the inside test, the memory budget decides within them
+MIN_INSIDE_CHUNK = 2**16
+MAX_INSIDE_CHUNK = 2**22
+# Voxels across the wall thickness when memory allows it
+VOXELS_PER_THICKNESS = 4
+# Empty voxels around the object, so the grid border is always outside
+GRID_PADDING = 2
+# Rays of the inside test go slightly off the voxel centers, to not hit triangle edges exactly
+RAY_JITTER = (1.234e-4, 2.718e-4)
+
+
+def grid_shape(low, high, size):
+    return tuple(int(side) for side in np.ceil((high - low) / size).astype(np.int64) + 2 * GRID_PADDING + 1)
+
+
+def voxel_memory(low, high, size, area, triangle_count):
+    """Return the rough peak memory of the voxel engine with voxels of size, apart from the inside test chunks: the
+    grids, the mesh arrays, and the larger of the distance band and the surface extraction arrays, which both grow
+    with the surface area."""
+    voxels = math.prod(grid_shape(low, high, size))
+    surface_voxels = area / size**2
+    band = min(voxels, BAND_LAYERS * surface_voxels) * BAND_VOXEL_BYTES
+    edges = EDGES_PER_SURFACE_VOXEL * surface_voxels * SURFACE_EDGE_BYTES
+    return voxels * VOXEL_BYTES + triangle_count * TRIANGLE_BYTES + max(band, edges)
+
+
+def voxel_size(low, high, thickness, area, triangle_count, memory_budget):
+    """Return the voxel size resolving the thickness with VOXELS_PER_THICKNESS voxels, or the smallest one whose
+    peak memory, with the smallest inside test chunks, fits in the memory budget."""
+    size = thickness / VOXELS_PER_THICKNESS
+    largest = max(high - low)
+    while (
+        voxel_memory(low, high, size, area, triangle_count) + MIN_INSIDE_CHUNK * INSIDE_PAIR_BYTES > memory_budget
+        and size < largest
+    ):
+        size *= 1.1
+    return size
+
+
+def inside_chunk(low, high, size, area, triangle_count, memory_budget):
+    """Return the triangle and column pairs the inside test can hold at once in the memory the rest leaves."""
+    left = memory_budget - voxel_memory(low, high, size, area, triangle_count)
+    return int(np.clip(left // INSIDE_PAIR_BYTES, MIN_INSIDE_CHUNK, MAX_INSIDE_CHUNK))
+
+
+def mesh_arrays(mesh):
+    """Return the (vertices, triangles) arrays of the mesh."""
+    mesh.calc_loop_triangles()
+    vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+    mesh.vertices.foreach_get("co", vertices)
+    triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int64)
+    mesh.loop_triangles.foreach_get("vertices", triangles)
+    return vertices.reshape(-1, 3), triangles.reshape(-1, 3)
+
+
+def surface_area(vertices, triangles):
+    corners = vertices[triangles]
+    return float(np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1).sum() / 2)
+
+
+def is_closed_manifold(triangles):
+    """Return whether every edge of the triangles is shared by exactly two of them, which the inside test needs:
+    a ray only crosses the surface of a closed mesh an odd number of times from inside it."""
+    if not len(triangles):
+        return False
+    edges = np.sort(np.concatenate([triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]]), axis=1)
+    _, counts = np.unique(edges[:, 0] * (int(triangles.max()) + 1) + edges[:, 1], return_counts=True)
+    return bool(np.all(counts == 2))
+
+
+@profiling.stage("make_hollow: inside test")
+def inside_voxels(vertices, triangles, origin, size, shape, chunk_size):
+    """Return a boolean grid of the voxel centers inside the closed mesh. A ray goes up every column of voxels and
+    the inside of the column is where it crossed the surface an odd number of times. About chunk_size triangle and
+    column pairs are tested at once."""
+    nx, ny, nz = shape
+    ray_x = origin[0] + size * RAY_JITTER[0]
+    ray_y = origin[1] + size * RAY_JITTER[1]
+    corners = vertices[triangles]
+    # Columns under the footprint of every triangle
+    low_i = np.ceil((corners[:, :, 0].min(axis=1) - ray_x) / size).astype(np.int64)
+    high_i = np.floor((corners[:, :, 0].max(axis=1) - ray_x) / size).astype(np.int64)
+    low_j = np.ceil((corners[:, :, 1].min(axis=1) - ray_y) / size).astype(np.int64)
+    high_j = np.floor((corners[:, :, 1].max(axis=1) - ray_y) / size).astype(np.int64)
+    width = np.maximum(high_i - low_i + 1, 0)
+    pairs = width * np.maximum(high_j - low_j + 1, 0)
+
+    # One toggle per ray crossing, at the first voxel above it
+    toggles = np.zeros(nx * ny * (nz + 1), dtype=np.uint8)
+    ends = np.cumsum(pairs)
+    start = 0
+    while start < len(triangles):
+        stop = max(int(np.searchsorted(ends, ends[start - 1] + chunk_size if start else chunk_size)), start + 1)
+        chunk = np.arange(start, min(stop, len(triangles)))
+        start = chunk[-1] + 1
+        counts = pairs[chunk]
+        if not counts.sum():
+            continue
+        triangle = np.repeat(chunk, counts)
+        offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        i = low_i[triangle] + offset % width[triangle]
+        j = low_j[triangle] + offset // width[triangle]
+        x = ray_x + i * size
+        y = ray_y + j * size
+
+        a, b, c = corners[triangle, 0], corners[triangle, 1], corners[triangle, 2]
+        # Barycentric coordinates of the ray in the triangle projected on XY
+        area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1])
+        u = ((b[:, 0] - x) * (c[:, 1] - y) - (c[:, 0] - x) * (b[:, 1] - y))
+        v = ((c[:, 0] - x) * (a[:, 1] - y) - (a[:, 0] - x) * (c[:, 1] - y))
+        w = area - u - v
+        sign = np.sign(area)
+        hit = (area != 0) & (u * sign >= 0) & (v * sign >= 0) & (w * sign >= 0)
+        z = (u[hit] * a[hit, 2] + v[hit] * b[hit, 2] + w[hit] * c[hit, 2]) / area[hit]
+        k = np.clip(np.ceil((z - origin[2]) / size), 0, nz).astype(np.int64)
+        cells, counts = np.unique((i[hit] * ny + j[hit]) * (nz + 1) + k, return_counts=True)
+        toggles[cells[counts % 2 == 1]] ^= 1
+
+    # Counting in uint8 wraps around at 256, which keeps the parity
+    crossings = np.cumsum(toggles.reshape(nx, ny, nz + 1), axis=2, dtype=np.uint8)
+    return (crossings[:, :, :nz] & 1).astype(bool)
+
+
+def erode(mask, steps):
+    """Erode the mask by a cube of 2 * steps + 1 voxels, one voxel layer per step on every axis."""
+    for _ in range(steps):
+        for axis in range(3):
+            shifted = np.ones_like(mask)
+            index = [slice(None)] * 3
+            index[axis] = slice(1, None)
+            lower = tuple(index)
+            index[axis] = slice(None, -1)
+            upper = tuple(index)
+            shifted[lower] &= mask[upper]
+            shifted[upper] &= mask[lower]
+            mask = mask & shifted
+    return mask
+
+
+def core_field_steps(obj, inside, origin, size, thickness):
+    """Job generator returning a grid that is positive in the core, the voxels deeper than thickness in the object,
+    and negative elsewhere. The erosion of the inside by the thickness gives the side of every voxel, and the exact
+    distance to the object surface minus the thickness, from BVH nearest point searches, is only measured in a band
+    of voxels around the erosion front. The distance changes by at most size from a voxel to the next, so the band
+    grows onto the neighbors a measured voxel can not vouch for, until every edge the surface crosses is measured."""
+    front = max(math.ceil(thickness / size), 1)
+    outer = erode(inside, front - 1)
+    core = erode(outer, 1)
+    band = np.flatnonzero(outer & ~erode(core, 2))
+    del outer
+    field = np.full(inside.shape, -thickness, dtype=np.float32)
+    field[core] = size
+    flat_field = field.reshape(-1)
+    flat_inside = inside.reshape(-1)
+    flat_core = core.reshape(-1)
+    measured = np.zeros(inside.size, dtype=bool)
+    strides = [inside.shape[1] * inside.shape[2], inside.shape[2], 1]
+    # The inside never touches the grid border, so the neighbors of a voxel are at these flat offsets
+    neighbors = np.array([offset for stride in strides for offset in (stride, -stride)])
+
+    with profiling.stage("make_hollow: surface tree"):
+        bvh = spatial_index.bvh_tree(obj)
+    # Farther than limit from the surface a voxel and its neighbors are in the core
+    limit = thickness + 2 * size
+    expected = 2 * len(band)
+    done = 0
+    batch = 20000
+    while len(band):
+        measured[band] = True
+        centers = origin + np.column_stack(np.unravel_index(band, inside.shape)) * size
+        distances = np.full(len(band), limit, dtype=np.float32)
+        for start in range(0, len(band), batch):
+            for n, co in enumerate(centers[start:start + batch].tolist(), start):
+                location = bvh.find_nearest(co, limit)[0]
+                if location is not None:
+                    distances[n] = (location - Vector(co)).length
+            done += min(batch, len(band) - start)
+            yield 0.3 + 0.4 * min(done / expected, 1)
+        values = distances - thickness
+        flat_field[band] = values
+
+        # Grow onto the inside neighbors that may be on the other side of the wall than the erosion says
+        around = (band[:, None] + neighbors).ravel()
+        values = np.repeat(values, len(neighbors))
+        doubtful = (np.abs(values) < size) | ((values > 0) != flat_core[around])
+        around = around[doubtful & flat_inside[around] & ~measured[around]]
+        band = np.unique(around)
+    return field
+
+
+@profiling.stage("make_hollow: extract surface")
+def surface_nets(field, origin, size):
+    """Return the (vertices, quads) of the zero surface of the field, with the faces pointing to its positive side.
+    Every grid cell the surface goes through gets one vertex at the mean of the crossings on its edges, and every
+    grid edge the surface crosses gets a quad joining the four cells around it."""
+    cells = np.array(field.shape) - 1
+    positive = field > 0
+    edges = []
+    for axis in range(3):
+        lower = [slice(None)] * 3
+        upper = [slice(None)] * 3
+        lower[axis] = slice(None, -1)
+        upper[axis] = slice(1, None)
+        changes = np.argwhere(positive[tuple(lower)] != positive[tuple(upper)])
+        step = np.zeros(3, dtype=np.int64)
+        step[axis] = 1
+        f0 = field[tuple(changes.T)]
+        f1 = field[tuple((changes + step).T)]
+        point = origin + (changes + np.outer(f0 / (f0 - f1), step)) * size
+        # The four cells sharing the edge, counterclockwise around the axis
+        others = [(axis + 1) % 3, (axis + 2) % 3]
+        around = []
+        for d0, d1 in ((0, 0), (1, 0), (1, 1), (0, 1)):
+            cell = changes.copy()
+            cell[:, others[0]] -= 1 - d0
+            cell[:, others[1]] -= 1 - d1
+            around.append(np.ravel_multi_index(cell.T, cells))
+        edges.append((np.stack(around, axis=1), point, positive[tuple((changes + step).T)]))
+
+    # One vertex per cell crossed by the surface, at the mean of the crossings around it
+    around = np.concatenate([cells_around for cells_around, _, _ in edges])
+    points = np.concatenate([np.repeat(point, 4, axis=0) for _, point, _ in edges])
+    active, vertex_index = np.unique(around.ravel(), return_inverse=True)
+    counts = np.bincount(vertex_index, minlength=len(active))
+    vertices = np.column_stack([
+        np.bincount(vertex_index, weights=points[:, component], minlength=len(active)) / counts
+        for component in range(3)
+    ])
+
+    quads = vertex_index.reshape(-1, 4)
+    # The quads around an edge face along the axis, turn them to face the positive side
+    upward = np.concatenate([upward for _, _, upward in edges])
+    quads[~upward] = quads[~upward, ::-1]
+    return vertices, quads
+
+
+def make_hollow_voxel_steps(obj, thickness, memory_budget=VOXEL_MEMORY_BUDGET, report=None):
+    """Job generator of the voxel engine of make_hollow_part, returning the object. The inside of the object is
+    sampled on a grid, the core is the part deeper than the thickness and its surface is added to the object as
+    the inner wall, facing the cavity. The voxel size follows from the thickness and the memory budget. Open and
+    non-manifold meshes have no inside to sample and go through the mesh engine instead, with a warning to the
+    operator's report function when one is given."""
+    mesh_utils.apply_transform(obj)
+    vertices, triangles = mesh_arrays(obj.data)
+    if not is_closed_manifold(triangles):
+        # The inside of an open or non-manifold mesh is not defined, the mesh engine does not need it
+        if report:
+            report({'WARNING'}, f"{obj.name} is not a closed manifold mesh, it was hollowed with the shrink and remesh engine")
+        return (yield from make_hollow_steps(obj, thickness))
+    low, high = vertices.min(axis=0), vertices.max(axis=0)
+    area = surface_area(vertices, triangles)
+    size = voxel_size(low, high, thickness, area, len(triangles), memory_budget)
+    origin = low - GRID_PADDING * size
+    shape = grid_shape(low, high, size)
+    chunk_size = inside_chunk(low, high, size, area, len(triangles), memory_budget)
+
+    inside = inside_voxels(vertices, triangles, origin, size, shape, chunk_size)
+    yield 0.3
+    field = yield from core_field_steps(obj, inside, origin, size, thickness)
+    del inside
+    core_vertices, core_faces = surface_nets(field, origin, size)
+    del field
+    yield 0.9
+    if not len(core_faces):
+        # The object is thinner than the wall everywhere, it stays solid
+        return obj
+
+    with profiling.stage("make_hollow: join"):
+        core = bpy.data.objects.new("Core", mesh_utils.new_mesh("Core", core_vertices, core_faces))
+        for collection in obj.users_collection:
+            collection.objects.link(core)
+        mesh_utils.join_meshes(obj, [core])
+    return obj
@@ -0,0 +1,211 @@
+import bpy
+import bmesh
+import numpy as np
+from mathutils import Matrix, Vector
+import spatial_index
+
+# Faces of a box whose 8 corners are ordered x, then y, then z (see box_vertices)
+BOX_FACES = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+
+
+def object_to_bmesh(obj):
+    """Return a new bmesh with the object's mesh in world coordinates."""
+    bm = bmesh.new()
+    bm.from_mesh(obj.data)
+    bm.transform(obj.matrix_world)
+    return bm
+
+
+def world_bounds(obj):
+    """Return the (min, max) corners of the object's bounding box in world coordinates."""
+    corners = [obj.matrix_world @ Vector(coord) for coord in obj.bound_box]
+    low = Vector([min(corner[i] for corner in corners) for i in range(3)])
+    high = Vector([max(corner[i] for corner in corners) for i in range(3)])
+    return low, high
+
+
+def world_vertices(obj):
+    """Return the vertex coordinates of the object's mesh in world coordinates as a (vertices, 3) array."""
+    coordinates = np.empty(len(obj.data.vertices) * 3)
+    obj.data.vertices.foreach_get("co", coordinates)
+    matrix = np.array(obj.matrix_world)
+    return coordinates.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def bmesh_islands(bm):
+    """Group the vertices of a bmesh into loose parts, like mesh.separate(type='LOOSE')."""
+    for vert in bm.verts:
+        vert.tag = False
+
+    islands = []
+    for vert in bm.verts:
+        if vert.tag:
+            continue
+        vert.tag = True
+        stack = [vert]
+        island = []
+        while stack:
+            current = stack.pop()
+            island.append(current)
+            for edge in current.link_edges:
+                other = edge.other_vert(current)
+                if not other.tag:
+                    other.tag = True
+                    stack.append(other)
+        islands.append(island)
+    return islands
+
+
+def island_geometry(island):
+    """Return the verts, edges and faces of an island as a single geom list."""
+    edges = dict.fromkeys(edge for vert in island for edge in vert.link_edges)
+    faces = dict.fromkeys(face for vert in island for face in vert.link_faces)
+    return list(island) + list(edges) + list(faces)
+
+
+def new_mesh_object(name, vertices, faces, collection):
+    """Create a mesh object from pydata and link it to the collection."""
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata(vertices, [], faces)
+    mesh.update()
+    obj = bpy.data.objects.new(name, mesh)
+    collection.objects.link(obj)
+    return obj
+
+
+def new_mesh(name, vertices, faces):
+    """Build a mesh from a (vertices, 3) array and either a (faces, corners) array or flat (starts, indices) arrays."""
+    if isinstance(faces, tuple):
+        starts, indices = faces
+    else:
+        starts = np.arange(0, faces.size, faces.shape[1], dtype=np.int32)
+        indices = faces.ravel()
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(vertices))
+    mesh.vertices.foreach_set("co", np.ascontiguousarray(vertices, dtype=np.float32).ravel())
+    mesh.loops.add(len(indices))
+    mesh.loops.foreach_set("vertex_index", indices)
+    mesh.polygons.add(len(starts))
+    # The polygon sizes follow from the loop starts
+    mesh.polygons.foreach_set("loop_start", starts)
+    mesh.update(calc_edges=True)
+    mesh.validate()
+    return mesh
+
+
+def box_vertices(low, high):
+    """Return the 8 corners of the axis-aligned box between low and high, in BOX_FACES order."""
+    return [(x, y, z) for x in (low[0], high[0]) for y in (low[1], high[1]) for z in (low[2], high[2])]
+
+
+def make_single_user(obj):
+    """Give the object a mesh of its own if other objects share it, so changing it leaves them alone."""
+    if obj.data.users > 1:
+        obj.data = obj.data.copy()
+
+
+def apply_transform(obj):
+    """Bake the object's transform into its mesh, like transform_apply without the operator.
+    The children keep their place in the world, and the normals of a mirrored mesh are flipped back outward."""
+    make_single_user(obj)
+    matrix = obj.matrix_world.copy()
+    obj.data.transform(matrix)
+    if matrix.is_negative:
+        obj.data.flip_normals()
+    obj.matrix_world = Matrix.Identity(4)
+    for child in obj.children:
+        child.matrix_parent_inverse = matrix @ child.matrix_parent_inverse
+    obj.data.update()
+    spatial_index.invalidate(obj)
+
+
+def duplicate_object(obj, name):
+    """Copy the object and its mesh into the collections of the original object."""
+    duplicate = obj.copy()
+    duplicate.data = obj.data.copy()
+    duplicate.name = name
+    for collection in obj.users_collection:
+        collection.objects.link(duplicate)
+    return duplicate
+
+
+def remove_object(obj):
+    """Delete the object together with its mesh if nothing else uses it."""
+    mesh = obj.data
+    bpy.data.objects.remove(obj)
+    if mesh.users == 0:
+        bpy.data.meshes.remove(mesh)
+
+
+def apply_modifiers(objects):
+    """Bake the modifier stack of every object into its mesh, with a single depsgraph evaluation."""
+    if not objects:
+        return
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    meshes = [bpy.data.meshes.new_from_object(obj.evaluated_get(depsgraph)) for obj in objects]
+    for obj, mesh in zip(objects, meshes):
+        old_mesh = obj.data
+        obj.modifiers.clear()
+        obj.data = mesh
+        if old_mesh.users == 0:
+            bpy.data.meshes.remove(old_mesh)
+
+
+def islands_to_objects(bm, islands, obj):
+    """Write every island of the bmesh into a mesh of its own, keeping the attribute layers of the bmesh (UVs,
+    colors, custom normals, material indices) and the materials and settings of the object's mesh.
+    The first island replaces the object's mesh, the other ones go to copies of the object in its collections.
+    Return the object followed by the copies."""
+    make_single_user(obj)
+    # An empty bmesh with the layers of bm, bmesh.ops.duplicate only copies the layers the destination has
+    template = bm.copy()
+    bmesh.ops.delete(template, geom=template.verts[:], context='VERTS')
+    template.to_mesh(obj.data)
+
+    parts = [obj]
+    # The first island goes last, the copies of the object must be made while its mesh is still empty
+    for island in islands[1:] + islands[:1]:
+        part_bm = template.copy()
+        bmesh.ops.duplicate(bm, geom=island_geometry(island), dest=part_bm)
+        if island is islands[0]:
+            part = obj
+        else:
+            part = obj.copy()
+            part.data = obj.data.copy()
+            for collection in obj.users_collection:
+                collection.objects.link(part)
+            parts.append(part)
+        part_bm.to_mesh(part.data)
+        part.data.update()
+        part_bm.free()
+    template.free()
+    spatial_index.invalidate(obj)
+    return parts
+
+
+def separate_loose(obj):
+    """Split the object into one object per loose part, like mesh.separate(type='LOOSE').
+    The first part stays in the object, the other ones are new objects in the same collections."""
+    bm = bmesh.new()
+    bm.from_mesh(obj.data)
+    islands = bmesh_islands(bm)
+    parts = [obj] if len(islands) <= 1 else islands_to_objects(bm, islands, obj)
+    bm.free()
+    return parts
+
+
+def join_meshes(obj, others):
+    """Append the meshes of the other objects to the object's mesh and delete them, like object.join."""
+    make_single_user(obj)
+    bm = bmesh.new()
+    bm.from_mesh(obj.data)
+    for other in others:
+        make_single_user(other)
+        other.data.transform(obj.matrix_world.inverted() @ other.matrix_world)
+        # from_mesh adds to the geometry already in the bmesh
+        bm.from_mesh(other.data)
+        remove_object(other)
+    bm.to_mesh(obj.data)
+    obj.data.update()
+    bm.free()
+    spatial_index.invalidate(obj)
@@ -2,9 +2,22 @@ import bpy
 import sys
 import os
 import itertools
+import time
+import numpy as np
+from mathutils import Matrix
 import curve_cut
 import make_hollow
 import cubit
+import cubit_parallel
+import jobs
+import exporter
+import importer
+import mesh_utils
+import orientation
+import proxy
+import profiling
+import spatial_index
+import scene_index
 
 # Get the current directory of the script being run
 current_dir = os.path.dirname(os.path.realpath(__file__))
@@ -14,42 +27,74 @@ if current_dir not in sys.path:
     sys.path.append(current_dir)
 
 
+def push_undo(message):
+    # There is no undo stack to push to in background Blender, the operators still run there from scripts
+    if bpy.ops.ed.undo_push.poll():
+        bpy.ops.ed.undo_push(message=message)
+
+
 class ImportMeshPropertiesGroup(bpy.types.PropertyGroup):
     # Define properties here
 
     def import_into_scene(self, context):
         # Get the path to the object file
         obj_path = bpy.path.abspath(self.import_object)
-        # Import the object into the scene
-        bpy.ops.wm.obj_import(filepath = obj_path)
+        extension = os.path.splitext(obj_path)[1].lower()
+        # Binary STL and PLY files are read directly, everything else goes through Blender's importers
+        imported_obj = importer.import_mesh(obj_path, context.collection)
+        if imported_obj:
+            bpy.ops.object.select_all(action='DESELECT')
+            context.view_layer.objects.active = imported_obj
+            imported_obj.select_set(True)
+        else:
+            if extension == ".stl" and bpy.app.version >= (4, 1, 0):
+                bpy.ops.wm.stl_import(filepath = obj_path)
+            elif extension == ".stl":
+                # The built-in STL importer came with Blender 4.1, 4.0 still has the legacy add-on
+                bpy.ops.import_mesh.stl(filepath = obj_path)
+            elif extension == ".ply":
+                bpy.ops.wm.ply_import(filepath = obj_path)
+            else:
+                bpy.ops.wm.obj_import(filepath = obj_path)
+            imported_obj = bpy.context.active_object
         # Set the selected object to the newly imported object
-        imported_obj = bpy.context.active_object
         context.scene.mesh_selector_tool.selected_object = imported_obj
 
     def setup_mesh(self, context):
-        #deselect all objects
-        bpy.ops.object.select_all(action='DESELECT')
         obj = context.scene.mesh_selector_tool.selected_object
-        bpy.context.view_layer.objects.active = obj
-        obj.select_set(True)
-        bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
-        bpy.ops.object.origin_set(type='ORIGIN_CENTER_OF_VOLUME')
-        bpy.ops.object.location_clear(clear_delta=False)
-        x_dim, y_dim, z_dim = obj.dimensions.x, obj.dimensions.y, obj.dimensions.z
-        largest_dim = max(x_dim, y_dim, z_dim)
-        if z_dim != largest_dim:
-            if x_dim == largest_dim:
-                bpy.ops.transform.rotate(value=1.5708, orient_axis='Y', orient_type='GLOBAL')
-            elif y_dim == largest_dim:
-                bpy.ops.transform.rotate(value=1.5708, orient_axis='X', orient_type='GLOBAL')
-                
-        # Move the object to the origin
-        
-        bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
-        lowest_point = min([v.co.z for v in obj.data.vertices])
-        obj.location.z -= lowest_point
-        bpy.context.scene.cursor.location = (0.0, 0.0, 0.0)
-        bpy.ops.object.origin_set(type='ORIGIN_CURSOR')
+        mesh_utils.apply_transform(obj)
+        mesh = obj.data
+        vertices = orientation.vertex_array(mesh)
+        # Center the volume of the model on the origin
+        center = orientation.volume_center(mesh, vertices)
+        vertices -= center
+
+        if self.optimize_orientation:
+            scene = context.scene
+            build_volume = (scene.printer_x, scene.printer_y, scene.printer_z)
+            rotation = orientation.best_rotation(vertices, scene.cubit_engine, scene.min_printer_dim, build_volume)
+        else:
+            # Turn the largest dimension upright
+            dimensions = np.ptp(vertices, axis=0)
+            rotation = np.identity(3)
+            if dimensions.argmax() == 0:
+                rotation = np.array([[0, 0, -1], [0, 1, 0], [1, 0, 0]])
+            elif dimensions.argmax() == 1:
+                rotation = np.array([[1, 0, 0], [0, 0, -1], [0, 1, 0]])
+        # Stand the model on the ground
+        lowest = vertices @ rotation[2]
+        matrix = np.identity(4)
+        matrix[:3, :3] = rotation
+        matrix[:3, 3] = -rotation @ center
+        matrix[2, 3] -= lowest.min()
+        # Mesh.transform turns the normals and the other layers along with the vertices
+        matrix = Matrix(matrix.tolist())
+        mesh.transform(matrix)
+        if matrix.is_negative:
+            mesh.flip_normals()
+        mesh.update()
+        spatial_index.invalidate(obj)
+
         #update model_height prop with height of model
         bpy.context.scene.model_height = obj.dimensions.z
         bpy.context.view_layer.update()
@@ -69,17 +114,24 @@ class ImportMeshPropertiesGroup(bpy.types.PropertyGroup):
         update=update_functions,
         description="Select the mesh to import",
     )  # type: ignore
+    optimize_orientation: bpy.props.BoolProperty(
+        name="Orient for fewest parts",
+        description="Rotate the imported mesh to the orientation cubit cuts into the fewest parts for the printer size",
+        default=True,
+    )  # type: ignore
 
 
 def set_selected_object_color(self, context):
 
     selected_obj = self.selected_object
-    for obj in context.scene.objects:
+    # Only the objects that are not white need resetting
+    for obj in scene_index.take_colored(context.scene):
         if obj != selected_obj:
             obj.color = (1, 1, 1, 1)  # RGBA
     if selected_obj:
         # Set the viewport display color to blue
         selected_obj.color = (0, 0, 1, 1)  # RGBA
+        scene_index.track_colored([selected_obj])
 
 
 
@@ -92,6 +144,8 @@ class SelectMeshProperties(bpy.types.PropertyGroup):
         bpy.context.space_data.clip_end = 1000
         
         
+        # Drawing on the previous object ends with the selection, its source is drawn again
+        proxy.show_sources(keep=self.selected_object)
         if self.selected_object:
             bpy.context.space_data.shading.color_type = 'OBJECT'
             set_selected_object_color(self, context)
@@ -109,15 +163,57 @@ class SelectMeshProperties(bpy.types.PropertyGroup):
     ) # type: ignore
 
 
-def update_model_height(self, context):
-    selected_object = bpy.context.scene.mesh_selector_tool.selected_object
-    desired_height = context.scene.model_height
+# While the height slider is dragged the object is drawn as its bounding box, it is rescaled once and drawn normally
+# again when the height has not changed for HEIGHT_SETTLE_TIME seconds, checked every HEIGHT_UPDATE_INTERVAL seconds
+HEIGHT_UPDATE_INTERVAL = 0.1
+HEIGHT_SETTLE_TIME = 0.4
+# object session_uid -> (object name, display type before the change, requested height, time of the last change)
+# of the objects with a pending height change
+height_changes = {}
 
 
-    if selected_object.type == 'MESH':
-        current_height = calculate_model_height(selected_object)
+def update_model_height(self, context):
+    selected_object = bpy.context.scene.mesh_selector_tool.selected_object
+    if not selected_object or selected_object.type != 'MESH':
+        return
+    uid = selected_object.session_uid
+    if uid not in height_changes and abs(calculate_model_height(selected_object) - context.scene.model_height) < 1e-6:
+        return
+
+    if uid in height_changes:
+        display_type = height_changes[uid][1]
+    else:
+        display_type = selected_object.display_type
+        selected_object.display_type = 'BOUNDS'
+    height_changes[uid] = (selected_object.name, display_type, context.scene.model_height, time.monotonic())
+    if not bpy.app.timers.is_registered(apply_model_height):
+        bpy.app.timers.register(apply_model_height, first_interval=HEIGHT_UPDATE_INTERVAL)
+
+
+def find_object(uid, name):
+    """Return the object with the session_uid, looked up by its last known name first."""
+    obj = bpy.data.objects.get(name)
+    if obj is not None and obj.session_uid == uid:
+        return obj
+    return next((obj for obj in bpy.data.objects if obj.session_uid == uid), None)
+
+
+def apply_model_height():
+    """Timer scaling every object whose height change has settled to its requested height, once."""
+    now = time.monotonic()
+    for uid, (name, display_type, desired_height, changed) in list(height_changes.items()):
+        if now - changed < HEIGHT_SETTLE_TIME:
+            continue
+        del height_changes[uid]
+        obj = find_object(uid, name)
+        if obj is None:
+            continue
+        current_height = calculate_model_height(obj)
         scale_factor = desired_height / current_height if current_height > 0 else 1
-        selected_object.scale = [scale_factor * axis for axis in selected_object.scale]
+        if scale_factor != 1:
+            obj.scale = [scale_factor * axis for axis in obj.scale]
+        obj.display_type = display_type
+    return HEIGHT_UPDATE_INTERVAL if height_changes else None
 
 def calculate_model_height(obj):
     # Assuming the object's origin is at its base, and we're only scaling in Z
@@ -150,6 +246,19 @@ class SetDrawOperator(bpy.types.Operator):
         (1, 0, 1, 1)   # Magenta
     ])
 
+    bpy.types.Scene.use_cut_proxy = bpy.props.BoolProperty(
+        name="Draw on a simplified copy",
+        description="Draw and place the cut lines on a decimated copy of dense objects, the object itself is only used to chop",
+        default=True,
+    )
+    bpy.types.Scene.cut_proxy_faces = bpy.props.IntProperty(
+        name="Faces",
+        description="Number of faces of the simplified copy",
+        default=200000,
+        min=10000,
+        max=5000000,
+    )
+
     @classmethod
     def poll(cls, context):
         if context.scene.mesh_selector_tool.selected_object is None:
@@ -159,9 +268,16 @@ class SetDrawOperator(bpy.types.Operator):
 
     def execute(self, context):
         bpy.context.space_data.shading.color_type = 'OBJECT'
+        selected_object = context.scene.mesh_selector_tool.selected_object
+        if context.scene.use_cut_proxy:
+            # Bake the transform first, so making the cutting objects does not change the object under the proxy
+            if selected_object.matrix_world != Matrix.Identity(4):
+                mesh_utils.apply_transform(selected_object)
+            proxy.show_proxy(selected_object, context.scene.cut_proxy_faces)
         # Assign a color from the list to the grease pencil
         color = next(self.colors)
         curve_cut.set_drawing(color)
+        scene_index.invalidate()
         return {'FINISHED'}
 
 class BorderThicknessTool(bpy.types.Operator):
@@ -192,114 +308,100 @@ class MakeCutMeshOperator(bpy.types.Operator):
         object_selected = context.scene.mesh_selector_tool.selected_object is not None
 
         # Check if "draw cuts" collection exists and is not empty
-        collection_exists = False
-
-        if "draw cuts" in bpy.data.collections:
-            collection = bpy.data.collections["draw cuts"]
-            for obj in collection.objects:
-                if obj.type == 'GPENCIL':
-                    for layer in obj.data.layers:
-                        for frame in layer.frames:
-                            if frame.strokes:
-                                collection_exists = True
-                                break
+        collection_exists = scene_index.has_strokes()
 
         # The operator can be executed if both conditions are True
         return object_selected and collection_exists
     
     def execute(self, context):
-        bpy.ops.ed.undo_push(message="MakeCutMeshOperator")
-        #set object mode
-        bpy.ops.object.mode_set(mode='OBJECT')
-        #Deselct all objects
-        bpy.ops.object.select_all(action='DESELECT')
-        object_selected = context.scene.mesh_selector_tool.selected_object
-        bpy.context.view_layer.objects.active = object_selected
-        object_selected.select_set(True)
-        #Apply all transformations to object_selected
-        bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
-        bpy.ops.object.select_all(action='DESELECT')
+        with profiling.operator(self.bl_label, context.scene.chopchop_profiling, context.scene.chopchop_profile_file):
+            push_undo("MakeCutMeshOperator")
+            #set object mode
+            bpy.ops.object.mode_set(mode='OBJECT')
+            #Deselct all objects
+            bpy.ops.object.select_all(action='DESELECT')
+            object_selected = context.scene.mesh_selector_tool.selected_object
+            #Apply all transformations to object_selected
+            if object_selected.matrix_world != Matrix.Identity(4):
+                mesh_utils.apply_transform(object_selected)
+            # The cut lines are projected on the simplified copy the user drew on
+            target = object_selected
+            if context.scene.use_cut_proxy:
+                target = proxy.get_proxy(object_selected, context.scene.cut_proxy_faces)
         
-        draw_cuts_collection = bpy.data.collections.get("draw cuts")
+            draw_cuts_collection = bpy.data.collections.get("draw cuts")
 
-        for gpencil_obj in [obj for obj in draw_cuts_collection.objects if obj.type == 'GPENCIL']:
+            try:
+                for gpencil_obj in [obj for obj in draw_cuts_collection.objects if obj.type == 'GPENCIL']:
 
-            curve_cut.refine_drawing(gpencil_obj,object_selected)
-            curve_cut.chop_obj()
+                    cut_line = curve_cut.refine_drawing(gpencil_obj, target)
+                    if cut_line:
+                        curve_cut.chop_obj(cut_line, target)
+            except Exception:
+                # Do not leave the object hidden behind its proxy when making the cutting objects fails
+                proxy.show_source(object_selected)
+                raise
 
-        draw_cuts_collection = bpy.data.collections.get("draw cuts")
+            draw_cuts_collection = bpy.data.collections.get("draw cuts")
 
-        if draw_cuts_collection:
-            bpy.data.collections.remove(draw_cuts_collection)
+            if draw_cuts_collection:
+                bpy.data.collections.remove(draw_cuts_collection)
+            scene_index.invalidate()
 
-        bpy.ops.object.select_all(action='DESELECT')
-        bpy.ops.ed.undo_push(message="MakeCutMeshOperator")
+            bpy.ops.object.select_all(action='DESELECT')
+            push_undo("MakeCutMeshOperator")
 
         return {'FINISHED'}
 
-class ChopitMeshOperator(bpy.types.Operator):
+class ChopitMeshOperator(jobs.ModalJob, bpy.types.Operator):
     bl_idname = "object.chopit"
     bl_label = "Chop it"
     bl_description = "Chop the selected mesh object using the Chop Objects created. You have to create a Chop Object first"
+    job_label = "Chopping"
     selected_object = None
+    bpy.types.Scene.chopit_merge_cutters = bpy.props.BoolProperty(
+        name="One Boolean for all cuts",
+        description="Cut the object with all the cutting objects in a single Boolean instead of one Boolean per cutting object",
+        default=True,
+    )
 
     @classmethod
     def poll(cls, context):
         # Check if selected_object is not None
         object_selected = context.scene.mesh_selector_tool.selected_object is not None
         # Check if "Cutting objects" collection exists and is not empty
-        collection_exists = False
-
-        if "Cutting objects" in bpy.data.collections:
-            collection = bpy.data.collections["Cutting objects"]
-            collection_exists = any(obj.type == 'MESH' for obj in collection.objects)
+        collection_exists = scene_index.has_cutters()
 
         # The operator can be executed if both conditions are True
         return object_selected and collection_exists
     
-    def execute(self, context):
-        bpy.ops.ed.undo_push(message="ChopitMeshOperator")
+    def steps(self, context):
+        push_undo("ChopitMeshOperator")
         # Get the selected object from the property group
         self.selected_object = context.scene.mesh_selector_tool.selected_object
-        bpy.ops.object.mode_set(mode='OBJECT')
-        #Deselct all objects
-        bpy.ops.object.select_all(action='DESELECT')
-        bpy.context.view_layer.objects.active = self.selected_object
-        #select the object
-        self.selected_object.select_set(True)
-        #Apply all transformations to object_selected
-        bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
-        # Call the chopit function
-        draw_cuts_collection = bpy.data.collections.get("Cutting objects")
-
-        if draw_cuts_collection:
-            for cut_obj in draw_cuts_collection.objects:
-                if cut_obj and cut_obj.type == 'MESH':
-                    curve_cut.chopit(cut_obj, self.selected_object)
-
-        # Apply all boolean modifiers in the selected object
-        context.view_layer.objects.active = self.selected_object
-
-        for modifier in self.selected_object.modifiers:
-            if modifier.type == 'BOOLEAN':
-                bpy.ops.object.modifier_apply(modifier=modifier.name)
+        if context.object and context.object.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+        # The Boolean always runs on the full resolution object, cancelling hides it behind its proxy again
+        self.snapshot.backup(self.selected_object)
+        proxy.show_source(self.selected_object)
 
         obj_cuts_collection = bpy.data.collections.get("Cutting objects")
+        cut_objs = [cut_obj for cut_obj in obj_cuts_collection.objects if cut_obj and cut_obj.type == 'MESH']
+        # Only the parts of earlier chops that the new cutting objects reach are cut again
+        parts = curve_cut.part_group(self.selected_object)
+        for part in curve_cut.changed_parts(parts, cut_objs):
+            self.snapshot.backup(part)
+        # Cut the parts and split them into loose parts
+        cut_collection = obj_cuts_collection if context.scene.chopit_merge_cutters else None
+        parts = yield from curve_cut.chop_parts_steps(parts, cut_objs, cut_collection)
+        bpy.data.collections.remove(obj_cuts_collection)
+        proxy.remove_proxy(self.selected_object)
+        scene_index.invalidate()
+        # The new parts are copies of the selected object and share its color
+        scene_index.track_colored(parts)
 
-        if obj_cuts_collection:
-            bpy.data.collections.remove(obj_cuts_collection)
-            
-        # Split the selected object into loose parts
-        bpy.ops.object.select_all(action='DESELECT')
-        self.selected_object.select_set(True)
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.separate(type='LOOSE')
-        bpy.ops.object.mode_set(mode='OBJECT')
         set_selected_object_color(self, context)
-        context.scene.mesh_selector_tool.z_dim = self.selected_object.dimensions.z 
-        bpy.ops.ed.undo_push(message="ChopitMeshOperator")
-
-        return {'FINISHED'}
+        push_undo("ChopitMeshOperator")
     
 class ExportProperties(bpy.types.PropertyGroup):
     export_folder: bpy.props.StringProperty(
@@ -307,6 +409,23 @@ class ExportProperties(bpy.types.PropertyGroup):
         subtype='DIR_PATH',
         description="Select the destination folder for exporting",
     )  # type: ignore
+    export_format: bpy.props.EnumProperty(
+        name="",
+        description="File format of the exported meshes",
+        items=[
+            ('STL', "STL", "One binary STL file per mesh"),
+            ('3MF', "3MF", "One 3MF file per mesh"),
+            ('OBJ', "OBJ", "One OBJ file per mesh, written by Blender's OBJ exporter (slow)"),
+            ('STL_ZIP', "STL bundle", "A single zip of binary STL files with a manifest.json of the parts"),
+            ('3MF_BUNDLE', "3MF bundle", "A single 3MF file with every mesh as an object"),
+        ],
+        default='STL',
+    )  # type: ignore
+    skip_unchanged: bpy.props.BoolProperty(
+        name="Skip unchanged meshes",
+        description="Only write the meshes that changed since they were last exported to this folder",
+        default=True,
+    )  # type: ignore
 
 class ExportAllMeshesOperator(bpy.types.Operator):
     bl_idname = "object.export_all_meshes"
@@ -318,24 +437,46 @@ class ExportAllMeshesOperator(bpy.types.Operator):
         return bool(context.scene.folder_selector_tool.export_folder)
 
     def execute(self, context):
-        export_folder = bpy.path.abspath(context.scene.folder_selector_tool.export_folder)
-
-        # Create the export folder if it doesn't exist
-        if not os.path.exists(export_folder):
-            os.makedirs(export_folder)
-
-        # Deselect all objects
-        bpy.ops.object.select_all(action='DESELECT')
-
-        # Export each mesh object in the current view layer
-        for obj in context.view_layer.objects:
-            if obj.type == 'MESH':
-                obj.select_set(True)
-                context.view_layer.objects.active = obj
-                bpy.ops.wm.obj_export(filepath=os.path.join(export_folder, f"{obj.name}.obj"), export_uv=False, export_normals=True, export_colors=False, export_materials=False, export_selected_objects = True)
-                obj.select_set(False)
-
-        self.report({'INFO'}, "Meshes exported successfully.")
+        with profiling.operator(self.bl_label, context.scene.chopchop_profiling, context.scene.chopchop_profile_file):
+            export_folder = bpy.path.abspath(context.scene.folder_selector_tool.export_folder)
+
+            # Create the export folder if it doesn't exist
+            if not os.path.exists(export_folder):
+                os.makedirs(export_folder)
+
+            export_format = context.scene.folder_selector_tool.export_format
+            meshes = [obj for obj in context.view_layer.objects if obj.type == 'MESH' and not proxy.is_proxy(obj)]
+            manifest = exporter.ExportManifest(export_folder) if context.scene.folder_selector_tool.skip_unchanged else None
+            try:
+                if export_format in exporter.BUNDLE_WRITERS:
+                    path = exporter.bundle_path(export_folder, export_format)
+                    written = len(meshes) if exporter.export_bundle(meshes, path, export_format, manifest) else 0
+                elif export_format != 'OBJ':
+                    written = len(exporter.export_objects(meshes, export_folder, export_format, manifest=manifest))
+                else:
+                    if manifest:
+                        targets = exporter.changed_objects(meshes, export_folder, "obj", manifest)
+                    else:
+                        targets = [(obj, os.path.join(export_folder, f"{obj.name}.obj"), None) for obj in meshes]
+                    written = len(targets)
+                    # Deselect all objects
+                    bpy.ops.object.select_all(action='DESELECT')
+
+                    # Export each mesh object in the current view layer
+                    for obj, path, digest in targets:
+                        obj.select_set(True)
+                        context.view_layer.objects.active = obj
+                        with profiling.stage("export: write obj"):
+                            result = bpy.ops.wm.obj_export(filepath=path, export_uv=False, export_normals=True, export_colors=False, export_materials=False, export_selected_objects = True)
+                        obj.select_set(False)
+                        if manifest and 'FINISHED' in result:
+                            manifest.record(path, digest)
+            finally:
+                # Keep the hashes of the files written before a failure
+                if manifest:
+                    manifest.save()
+
+        self.report({'INFO'}, f"Meshes exported successfully, {len(meshes) - written} unchanged meshes skipped.")
         return {'FINISHED'}
 
 class ShellThicknessTool(bpy.types.Operator):
@@ -353,19 +494,36 @@ class ShellThicknessTool(bpy.types.Operator):
         print("Shell Thickness:", self.shell_thickness)
         return {'FINISHED'}
 
-class MakeHollowOperator(bpy.types.Operator):
+class MakeHollowOperator(jobs.ModalJob, bpy.types.Operator):
     bl_idname = "object.make_hollow"
     bl_label = "Make Hollow"
+    job_label = "Hollowing"
+    bpy.types.Scene.hollow_engine = bpy.props.EnumProperty(
+        name="",
+        description="Choose how the inner wall is made",
+        items=[
+            ('MESH', "Shrink and remesh", "Shrink a copy of the mesh step by step and clean it up with remeshes and a Boolean"),
+            ('VOXEL', "Distance field", "Build the inner wall from a voxel distance field of the object in one pass"),
+        ],
+        default='MESH',
+    )
 
     @classmethod
     def poll(cls, context):
         # Check if selected_object is not None
         object_is_selected = context.scene.mesh_selector_tool.selected_object is not None
         return object_is_selected
-    def execute(self, context):
+    def steps(self, context):
+        selected_object = context.scene.mesh_selector_tool.selected_object
+        self.snapshot.backup(selected_object)
+        proxy.show_source(selected_object)
         # Call the make_hollow function
-        make_hollow.make_hollow_part(context.scene.mesh_selector_tool.selected_object, context.scene.shell_thickness)
-        return {'FINISHED'}
+        if context.scene.hollow_engine == 'VOXEL':
+            yield from make_hollow.make_hollow_voxel_steps(
+                selected_object, context.scene.shell_thickness, report=self.report
+            )
+        else:
+            yield from make_hollow.make_hollow_steps(selected_object, context.scene.shell_thickness)
 
 
 class PrinterDimTool(bpy.types.Operator):
@@ -386,10 +544,54 @@ class PrinterDimTool(bpy.types.Operator):
         print("Minimum Dimension:", self.min_dim)
         return {'FINISHED'}
 
-class CubitOperator(bpy.types.Operator):
+class CubitOperator(jobs.ModalJob, bpy.types.Operator):
     bl_idname = "object.cubit"
     bl_label = "Cut into cubes"
     bl_description = "cuts the selected object into managable cubes"
+    job_label = "Cutting into cubes"
+    bpy.types.Scene.cubit_engine = bpy.props.EnumProperty(
+        name="",
+        description="Choose how the object is cut into cubes",
+        items=[
+            ('BOOLEAN', "Boolean", "Intersect the object with one cutting cube per grid cell"),
+            ('SLICE', "Slice", "Slice the mesh along every grid plane and cap the cuts in one pass"),
+            ('FIT', "Fit to printer", "Only split the parts that do not fit the printer's build volume"),
+        ],
+        default='BOOLEAN',
+    )
+    bpy.types.Scene.printer_x = bpy.props.FloatProperty(
+        name="X",
+        description="Width of the printer's build volume",
+        default=20.0,  # Default value
+        min=5.0,  # Minimum value
+        max=100.0,  # Maximum value
+    )
+    bpy.types.Scene.printer_y = bpy.props.FloatProperty(
+        name="Y",
+        description="Depth of the printer's build volume",
+        default=20.0,  # Default value
+        min=5.0,  # Minimum value
+        max=100.0,  # Maximum value
+    )
+    bpy.types.Scene.printer_z = bpy.props.FloatProperty(
+        name="Z",
+        description="Height of the printer's build volume",
+        default=20.0,  # Default value
+        min=5.0,  # Minimum value
+        max=100.0,  # Maximum value
+    )
+    bpy.types.Scene.cubit_batch_booleans = bpy.props.BoolProperty(
+        name="One Boolean per slab",
+        description="Intersect all the cubes of a slab with a single Boolean instead of one Boolean per cube",
+        default=True,
+    )
+    bpy.types.Scene.cubit_workers = bpy.props.IntProperty(
+        name="",
+        description="Number of background Blender processes cutting the object, 1 cuts it in this process",
+        default=1,  # Default value
+        min=1,  # Minimum value
+        max=64,  # Maximum value
+    )
 
     @classmethod
     def poll(cls, context):
@@ -397,15 +599,27 @@ class CubitOperator(bpy.types.Operator):
         object_is_selected = context.scene.mesh_selector_tool.selected_object is not None
         return object_is_selected
     
-    def execute(self, context):
-        bpy.ops.ed.undo_push(message="CubitOperator")
-        cubit.cubit(context.scene.mesh_selector_tool.selected_object, context.scene.min_printer_dim)
-        bpy.context.space_data.shading.color_type = 'RANDOM'
-
-        return {'FINISHED'}
+    def steps(self, context):
+        push_undo("CubitOperator")
+        selected_object = context.scene.mesh_selector_tool.selected_object
+        self.snapshot.backup(selected_object)
+        proxy.show_source(selected_object)
+        build_volume = (context.scene.printer_x, context.scene.printer_y, context.scene.printer_z)
+        # The fit engine does not lay a grid, so its slabs can not be farmed out
+        if context.scene.cubit_workers > 1 and context.scene.cubit_engine != 'FIT':
+            yield from cubit_parallel.cubit_parallel_steps(selected_object, context.scene.min_printer_dim, context.scene.cubit_engine, context.scene.cubit_workers, context.scene.cubit_batch_booleans)
+        else:
+            yield from cubit.cubit_steps(selected_object, context.scene.min_printer_dim, context.scene.cubit_engine, build_volume=build_volume, batched=context.scene.cubit_batch_booleans)
+        if context.space_data:
+            context.space_data.shading.color_type = 'RANDOM'
 
 def register():
 
+    jobs.register()
+    profiling.register()
+    spatial_index.register()
+    scene_index.register()
+    proxy.register()
     bpy.utils.register_class(ImportMeshPropertiesGroup)
     bpy.types.Scene.mesh_importer_tool = bpy.props.PointerProperty(type=ImportMeshPropertiesGroup)
     bpy.utils.register_class(SelectMeshProperties)
@@ -439,4 +653,12 @@ def unregister():
     bpy.utils.unregister_class(ShellThicknessTool)
     bpy.utils.unregister_class(MakeHollowOperator)
     bpy.utils.unregister_class(CubitOperator)
+    jobs.unregister()
+    profiling.unregister()
+    spatial_index.unregister()
+    scene_index.unregister()
+    proxy.unregister()
+    if bpy.app.timers.is_registered(apply_model_height):
+        bpy.app.timers.unregister(apply_model_height)
+    height_changes.clear()
 
@@ -0,0 +1,106 @@
+"""Choice of the print orientation of an imported model. Candidate rotations from the principal axes and the
+tightest bounding boxes of the vertices are scored by an estimate of the number of parts cubit would cut the
+model into, and the rotation giving the fewest parts wins."""
+import math
+import numpy as np
+
+# Vertices used to score the orientations, larger models are subsampled
+SAMPLE_SIZE = 50000
+# Angle step in degrees of the search for the tightest footprint around the vertical axis
+YAW_STEP = 5
+
+
+def vertex_array(mesh):
+    """Return the vertex coordinates of the mesh as a (vertices, 3) array."""
+    coordinates = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+    mesh.vertices.foreach_get("co", coordinates)
+    return coordinates.reshape(-1, 3)
+
+
+def volume_center(mesh, vertices):
+    """Return the center of the volume enclosed by the mesh, or the mean of its vertices if it encloses none,
+    like origin_set(type='ORIGIN_CENTER_OF_VOLUME')."""
+    mesh.calc_loop_triangles()
+    triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("vertices", triangles)
+    corners = vertices[triangles.reshape(-1, 3)]
+    # Signed volumes of the tetrahedra between the origin and every triangle
+    volumes = np.einsum("ij,ij->i", corners[:, 0], np.cross(corners[:, 1], corners[:, 2])) / 6
+    total = volumes.sum()
+    if abs(total) < 1e-12:
+        return vertices.mean(axis=0) if len(vertices) else np.zeros(3)
+    return (volumes[:, None] * corners.sum(axis=1) / 4).sum(axis=0) / total
+
+
+def rotation_about_z(angle):
+    cos, sin = math.cos(angle), math.sin(angle)
+    return np.array([[cos, -sin, 0], [sin, cos, 0], [0, 0, 1]])
+
+
+def up_rotation(axis):
+    """Return a rotation turning the unit axis onto Z."""
+    axis = axis / np.linalg.norm(axis)
+    helper = np.array([1.0, 0.0, 0.0]) if abs(axis[0]) < 0.9 else np.array([0.0, 1.0, 0.0])
+    x_axis = np.cross(helper, axis)
+    x_axis /= np.linalg.norm(x_axis)
+    y_axis = np.cross(axis, x_axis)
+    return np.array([x_axis, y_axis, axis])
+
+
+def tightest_yaw(points):
+    """Return the rotation about Z giving the smallest footprint of the points, the base of a minimum volume
+    oriented bounding box with that vertical axis."""
+    best_area, best_rotation = None, np.identity(3)
+    for degrees in range(0, 90, YAW_STEP):
+        rotation = rotation_about_z(math.radians(degrees))
+        footprint = points[:, :2] @ rotation[:2, :2].T
+        area = np.prod(footprint.max(axis=0) - footprint.min(axis=0))
+        if best_area is None or area < best_area:
+            best_area, best_rotation = area, rotation
+    return best_rotation
+
+
+def candidate_rotations(points):
+    """Return the rotations worth scoring: the current orientation, then the world and principal axes turned
+    upright, each also with its footprint aligned with the printer axes."""
+    centered = points - points.mean(axis=0)
+    _, axes = np.linalg.eigh(np.cov(centered.T))
+    up_axes = list(np.identity(3)) + list(axes.T)
+    candidates = [np.identity(3)]
+    for up_axis in up_axes:
+        for sign in (1, -1):
+            upright = up_rotation(up_axis * sign)
+            candidates.append(upright)
+            candidates.append(tightest_yaw(centered @ upright.T) @ upright)
+    return candidates
+
+
+def estimate_parts(points, engine, print_size, build_volume=None):
+    """Estimate the number of parts cubit makes of the points. The grid engines lay cubes of print_size from the
+    top of the model, every occupied column of cells is counted from its lowest to its highest cell. The fit engine
+    splits the box of the model evenly into pieces that fit the build volume in any orientation."""
+    low, high = points.min(axis=0), points.max(axis=0)
+    if engine == 'FIT':
+        dimensions = np.sort(high - low)
+        return int(np.prod(np.maximum(np.ceil(dimensions / np.sort(build_volume)), 1)))
+    cells = np.floor((high - points) / print_size).astype(np.int64)
+    columns = cells[:, 0] * (cells[:, 1].max() + 1) + cells[:, 1]
+    order = np.argsort(columns, kind="stable")
+    columns, layers = columns[order], cells[order, 2]
+    starts = np.flatnonzero(np.r_[True, columns[1:] != columns[:-1]])
+    return int((np.maximum.reduceat(layers, starts) - np.minimum.reduceat(layers, starts) + 1).sum())
+
+
+def best_rotation(vertices, engine, print_size, build_volume=None):
+    """Return the candidate rotation giving the fewest parts, the tallest one among equals."""
+    points = vertices
+    if len(points) > SAMPLE_SIZE:
+        points = points[np.random.default_rng(0).choice(len(points), SAMPLE_SIZE, replace=False)]
+    best_score, best = None, np.identity(3)
+    for rotation in candidate_rotations(points):
+        rotated = points @ rotation.T
+        height = np.ptp(rotated[:, 2])
+        score = (estimate_parts(rotated, engine, print_size, build_volume), -height)
+        if best_score is None or score < best_score:
+            best_score, best = score, rotation
+    return best
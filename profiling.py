@@ -0,0 +1,97 @@
+"""Per stage instrumentation of the pipeline, switched on from the ChopChop panel.
+A stage records its wall time, number of calls and Python allocation delta. Stages nest, so the time of a stage
+includes the stages it calls. Use stage(name) as a context manager or as a function decorator, and operator(...)
+around the whole operator.
+The allocation delta comes from tracemalloc and only counts the memory allocated through Python (NumPy arrays,
+Python objects). The C allocations of bmesh, the Boolean solver, modifiers and mesh datablocks are not included."""
+import bpy
+import contextlib
+import json
+import time
+import tracemalloc
+
+enabled = False
+# stage name -> [calls, seconds, allocated bytes] of the operator being profiled
+stats = {}
+# (operator, total seconds, [(stage name, calls, seconds, allocated bytes)]) of the last profiled operator
+last_report = None
+start_time = 0.0
+
+
+@contextlib.contextmanager
+def stage(name):
+    if not enabled:
+        yield
+        return
+    start_memory = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = stats.setdefault(name, [0, 0.0, 0])
+        record[0] += 1
+        record[1] += time.perf_counter() - start
+        record[2] += tracemalloc.get_traced_memory()[0] - start_memory
+
+
+def begin(enable):
+    """Start profiling an operator when enable is set."""
+    global enabled, start_time
+    enabled = enable
+    stats.clear()
+    if enabled:
+        tracemalloc.start()
+        start_time = time.perf_counter()
+
+
+def end(operator, dump_path=""):
+    """Stop profiling the operator, keep its report for the panel and append it to dump_path as a JSON line."""
+    global enabled, last_report
+    if not enabled:
+        return
+    enabled = False
+    tracemalloc.stop()
+    stages = sorted(((name, *record) for name, record in stats.items()), key=lambda row: row[2], reverse=True)
+    last_report = (operator, time.perf_counter() - start_time, stages)
+
+    if dump_path:
+        entry = {
+            "operator": operator,
+            "total_time": last_report[1],
+            "stages": [
+                {"stage": name, "calls": calls, "wall_time": seconds, "allocated_bytes": allocated}
+                for name, calls, seconds, allocated in stages
+            ],
+        }
+        with open(bpy.path.abspath(dump_path), "a") as dump_file:
+            dump_file.write(json.dumps(entry) + "\n")
+
+
+@contextlib.contextmanager
+def operator(name, enable, dump_path=""):
+    """Profile the operator called name for the duration of the block when enable is set, see begin and end.
+    The profile is closed even when the block raises, so tracemalloc never keeps running after the operator."""
+    begin(enable)
+    try:
+        yield
+    finally:
+        end(name, dump_path)
+
+
+def register():
+    bpy.types.Scene.chopchop_profiling = bpy.props.BoolProperty(
+        name="Profile operators",
+        description="Record the time, calls and Python allocations of every stage of the ChopChop operators. "
+                    "The memory of bmesh, Booleans and meshes is not counted",
+        default=False,
+    )
+    bpy.types.Scene.chopchop_profile_file = bpy.props.StringProperty(
+        name="",
+        subtype='FILE_PATH',
+        description="File to append the profile of every operator to, as JSON lines",
+    )
+
+
+def unregister():
+    del bpy.types.Scene.chopchop_profiling
+    del bpy.types.Scene.chopchop_profile_file
@@ -0,0 +1,156 @@
+"""Decimated stand-ins of dense models for drawing and projecting cut lines.
+The proxy is shown instead of the model while the cut lines are drawn and turned into cutting objects. It is rebuilt
+when the geometry or the transform of the model changes, and the model itself is only used for the final Boolean."""
+import bpy
+import mesh_utils
+import profiling
+import spatial_index
+
+PROXY_COLLECTION = "ChopChop proxies"
+# Custom property of a proxy object naming the object it stands in for
+PROXY_PROPERTY = "chopchop_proxy_of"
+# Custom properties of the parts that must not be copied to a proxy
+PART_PROPERTIES = ("chopit_group", "cubit_order")
+
+# source session_uid -> (geometry key of the source when the proxy was built, proxy session_uid, proxy name)
+proxies = {}
+
+
+def is_proxy(obj):
+    return PROXY_PROPERTY in obj
+
+
+def source_key(source):
+    """Return a value that changes whenever the world space geometry of the source changes, from the geometry
+    versions spatial_index keeps up to date."""
+    mesh = source.data
+    return (
+        mesh.session_uid,
+        spatial_index.geometry_version(mesh),
+        len(mesh.vertices),
+        len(mesh.polygons),
+        tuple(tuple(row) for row in source.matrix_world),
+    )
+
+
+def find_proxy(source):
+    """Return the current proxy object of the source, or None."""
+    _, uid, name = proxies.get(source.session_uid, (None, None, None))
+    if uid is None:
+        return None
+    proxy = bpy.data.objects.get(name)
+    if proxy is not None and proxy.session_uid == uid:
+        return proxy
+    return next((obj for obj in bpy.data.objects if obj.session_uid == uid), None)
+
+
+def proxy_collection():
+    collection = bpy.data.collections.get(PROXY_COLLECTION)
+    if not collection:
+        collection = bpy.data.collections.new(PROXY_COLLECTION)
+        bpy.context.scene.collection.children.link(collection)
+    return collection
+
+
+@profiling.stage("proxy: build")
+def build_proxy(source, face_limit):
+    """Return a new object with the evaluated mesh of the source decimated to about face_limit faces,
+    in world coordinates."""
+    proxy = mesh_utils.duplicate_object(source, f"{source.name} proxy")
+    for collection in proxy.users_collection:
+        collection.objects.unlink(proxy)
+    proxy_collection().objects.link(proxy)
+    for name in PART_PROPERTIES:
+        if name in proxy:
+            del proxy[name]
+    proxy[PROXY_PROPERTY] = source.name
+    proxy.hide_select = True
+
+    decimate_modifier = proxy.modifiers.new(name="Decimate", type='DECIMATE')
+    decimate_modifier.ratio = face_limit / len(source.data.polygons)
+    mesh_utils.apply_modifiers([proxy])
+    mesh_utils.apply_transform(proxy)
+    return proxy
+
+
+def remove_proxy(source):
+    """Delete the proxy of the source, if it has one, including proxies left from an earlier session."""
+    proxy = find_proxy(source)
+    proxies.pop(source.session_uid, None)
+    if proxy is not None:
+        mesh_utils.remove_object(proxy)
+    collection = bpy.data.collections.get(PROXY_COLLECTION)
+    if collection:
+        for obj in list(collection.objects):
+            if obj.get(PROXY_PROPERTY) == source.name:
+                mesh_utils.remove_object(obj)
+
+
+def get_proxy(source, face_limit):
+    """Return the up to date proxy of the source, or the source itself when it has at most face_limit faces."""
+    if len(source.data.polygons) <= face_limit:
+        remove_proxy(source)
+        return source
+    key = source_key(source)
+    proxy = find_proxy(source)
+    if proxy is None or proxies[source.session_uid][0] != key:
+        remove_proxy(source)
+        proxy = build_proxy(source, face_limit)
+        proxies[source.session_uid] = (key, proxy.session_uid, proxy.name)
+    return proxy
+
+
+def show_proxy(source, face_limit):
+    """Draw the proxy of the source instead of the source, and return it."""
+    proxy = get_proxy(source, face_limit)
+    if proxy is not source:
+        set_hidden(proxy, False)
+        set_hidden(source, True)
+    return proxy
+
+
+def set_hidden(obj, hidden):
+    # Objects outside the view layer can not be hidden or shown
+    if obj.name in bpy.context.view_layer.objects:
+        obj.hide_set(hidden)
+
+
+def show_source(source):
+    """Draw the source again instead of its proxy."""
+    set_hidden(source, False)
+    proxy = find_proxy(source)
+    if proxy:
+        set_hidden(proxy, True)
+
+
+def show_sources(keep=None):
+    """Draw again every source hidden behind a proxy, except keep. Called on every way out of drawing cut lines,
+    proxies left in the file by an earlier session included."""
+    if proxies:
+        for source in [obj for obj in bpy.data.objects if obj.session_uid in proxies]:
+            if source != keep:
+                show_source(source)
+    collection = bpy.data.collections.get(PROXY_COLLECTION)
+    if not collection:
+        return
+    for proxy in collection.objects:
+        source = bpy.data.objects.get(proxy.get(PROXY_PROPERTY, ""))
+        if source is not None and source != keep:
+            set_hidden(source, False)
+            set_hidden(proxy, True)
+
+
+@bpy.app.handlers.persistent
+def on_load(*args):
+    proxies.clear()
+    show_sources()
+
+
+def register():
+    bpy.app.handlers.load_post.append(on_load)
+
+
+def unregister():
+    bpy.app.handlers.load_post.remove(on_load)
+    show_sources()
+    proxies.clear()
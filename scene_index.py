@@ -0,0 +1,111 @@
+"""Scene state the panel asks for on every redraw, recomputed only after the scene changed.
+The operator polls read whether there are strokes to make cutting objects from and cutting objects to chop with,
+and set_selected_object_color only visits the objects it colored instead of the whole scene."""
+import bpy
+
+WHITE = (1.0, 1.0, 1.0, 1.0)
+
+# None when the scene changed since the last lookup
+drawing_ready = None
+cutters_ready = None
+# session_uid -> last known name of the objects with a viewport color other than white, None until the scene
+# has been scanned once
+colored = None
+
+
+def has_strokes():
+    """Return whether a grease pencil object in "draw cuts" has strokes."""
+    global drawing_ready
+    if drawing_ready is None:
+        collection = bpy.data.collections.get("draw cuts")
+        drawing_ready = bool(collection) and any(
+            frame.strokes
+            for obj in collection.objects if obj.type == 'GPENCIL'
+            for layer in obj.data.layers
+            for frame in layer.frames
+        )
+    return drawing_ready
+
+
+def has_cutters():
+    """Return whether "Cutting objects" holds a mesh."""
+    global cutters_ready
+    if cutters_ready is None:
+        collection = bpy.data.collections.get("Cutting objects")
+        cutters_ready = bool(collection) and any(obj.type == 'MESH' for obj in collection.objects)
+    return cutters_ready
+
+
+def is_colored(obj):
+    return tuple(obj.color) != WHITE
+
+
+def take_colored(scene):
+    """Return the objects of the scene that may have a color other than white, and forget them."""
+    global colored
+    if colored is None:
+        colored = {obj.session_uid: obj.name for obj in scene.objects if is_colored(obj)}
+    objects = []
+    renamed = False
+    for uid, name in colored.items():
+        obj = scene.objects.get(name)
+        if obj is not None and obj.session_uid == uid:
+            objects.append(obj)
+        else:
+            renamed = True
+    if renamed:
+        # Find the objects renamed since they were tracked, the others are gone
+        by_uid = {obj.session_uid: obj for obj in scene.objects}
+        objects = [by_uid[uid] for uid in colored if uid in by_uid]
+    colored = {}
+    return objects
+
+
+def track(obj):
+    colored[obj.session_uid] = obj.name
+
+
+def track_colored(objects):
+    """Remember objects given a color by the add-on before the depsgraph reported them."""
+    if colored is not None:
+        for obj in objects:
+            if is_colored(obj):
+                track(obj)
+
+
+def invalidate():
+    global drawing_ready, cutters_ready
+    drawing_ready = None
+    cutters_ready = None
+
+
+@bpy.app.handlers.persistent
+def on_depsgraph_update(scene, depsgraph):
+    for update in depsgraph.updates:
+        data = update.id.original
+        if isinstance(data, (bpy.types.Scene, bpy.types.Collection, bpy.types.Object, bpy.types.GreasePencil)):
+            invalidate()
+        if isinstance(data, bpy.types.Object) and colored is not None and is_colored(data):
+            track(data)
+
+
+@bpy.app.handlers.persistent
+def on_load(*args):
+    global colored
+    invalidate()
+    colored = None
+
+
+def register():
+    bpy.app.handlers.depsgraph_update_post.append(on_depsgraph_update)
+    bpy.app.handlers.load_post.append(on_load)
+    # Undo and redo bring back an older scene, colors included, so it is scanned again like after a load
+    bpy.app.handlers.undo_post.append(on_load)
+    bpy.app.handlers.redo_post.append(on_load)
+
+
+def unregister():
+    bpy.app.handlers.depsgraph_update_post.remove(on_depsgraph_update)
+    bpy.app.handlers.load_post.remove(on_load)
+    bpy.app.handlers.undo_post.remove(on_load)
+    bpy.app.handlers.redo_post.remove(on_load)
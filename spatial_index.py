@@ -0,0 +1,151 @@
+"""Shared cache of the BVH trees of the meshes the add-on queries, in world coordinates.
+Trees are keyed by mesh and rebuilt when the mesh geometry or the object's transform changes. Geometry changes
+are picked up from the is_updated_geometry flag of depsgraph updates, edits made by the add-on itself call
+invalidate(obj), and undo and redo drop the cached trees. The trees of objects in transient collections (the
+intermediate parts of cubit) are built for the query but not kept, so they do not push the others out.
+surface_distances answers many bounded nearest surface queries at once from the cached BVH tree."""
+import bpy
+import numpy as np
+from collections import OrderedDict
+from mathutils.bvhtree import BVHTree
+import mesh_utils
+
+# Rough upper bound of the memory used by the cached trees, the least recently used ones are dropped past it
+MEMORY_BUDGET = 512 * 2**20
+# Approximate bytes used by a tree per face
+BVH_FACE_BYTES = 96
+
+# Custom property of the collections whose objects are not cached
+TRANSIENT_PROPERTY = "chopchop_transient"
+
+# mesh session_uid -> CacheEntry, least recently used first
+cache = OrderedDict()
+# mesh session_uid -> geometry version, bumped on every geometry update
+versions = {}
+
+
+class CacheEntry:
+    def __init__(self, key):
+        self.key = key
+        self.bvh = None
+        self.size = 0
+
+
+def entry_key(obj):
+    """Everything a world space tree of the object depends on."""
+    mesh = obj.data
+    return (
+        geometry_version(mesh),
+        len(mesh.vertices),
+        len(mesh.polygons),
+        tuple(tuple(row) for row in obj.matrix_world),
+    )
+
+
+def is_transient(obj):
+    return any(collection.get(TRANSIENT_PROPERTY) for collection in obj.users_collection)
+
+
+def get_entry(obj):
+    uid = obj.data.session_uid
+    key = entry_key(obj)
+    if is_transient(obj):
+        return CacheEntry(key)
+    entry = cache.get(uid)
+    if entry is None or entry.key != key:
+        entry = CacheEntry(key)
+        cache[uid] = entry
+    cache.move_to_end(uid)
+    return entry
+
+
+def bvh_tree(obj):
+    """Return the BVH tree of the object's surface in world coordinates."""
+    entry = get_entry(obj)
+    if entry.bvh is None:
+        bm = mesh_utils.object_to_bmesh(obj)
+        entry.bvh = BVHTree.FromBMesh(bm)
+        bm.free()
+        entry.size += len(obj.data.polygons) * BVH_FACE_BYTES
+        evict()
+    return entry.bvh
+
+
+def surface_distances(obj, points, limit):
+    """Return the distance from every point, in world coordinates, to the surface of the object, or limit for the
+    points farther away. All the points go through the cached BVH tree in one pass, the searches bounded by limit."""
+    bvh = bvh_tree(obj)
+    distances = np.full(len(points), float(limit))
+    for n, co in enumerate(np.asarray(points, dtype=np.float64).tolist()):
+        location, _, _, distance = bvh.find_nearest(co, limit)
+        if location is not None:
+            distances[n] = distance
+    return distances
+
+
+def evict():
+    """Drop the least recently used trees until the cache fits in the memory budget, always keeping the newest one."""
+    total = sum(entry.size for entry in cache.values())
+    while total > MEMORY_BUDGET and len(cache) > 1:
+        _, entry = cache.popitem(last=False)
+        total -= entry.size
+
+
+def invalidate(obj):
+    """Mark the geometry of the object's mesh as changed."""
+    invalidate_mesh(obj.data)
+
+
+def invalidate_mesh(mesh):
+    uid = mesh.session_uid
+    versions[uid] = versions.get(uid, 0) + 1
+    cache.pop(uid, None)
+
+
+def clear():
+    cache.clear()
+    versions.clear()
+
+
+@bpy.app.handlers.persistent
+def on_depsgraph_update(scene, depsgraph):
+    for update in depsgraph.updates:
+        if not update.is_updated_geometry:
+            continue
+        data = update.id.original
+        if isinstance(data, bpy.types.Object) and data.type == 'MESH':
+            invalidate(data)
+        elif isinstance(data, bpy.types.Mesh):
+            invalidate_mesh(data)
+
+
+@bpy.app.handlers.persistent
+def on_load(*args):
+    clear()
+
+
+@bpy.app.handlers.persistent
+def on_undo(*args):
+    # Undo brings back older geometry under the same session_uid. The versions only ever grow, so a key taken
+    # before the undo can not match again
+    cache.clear()
+
+
+def geometry_version(mesh):
+    """Return a number that changes whenever the geometry of the mesh changes, within a session."""
+    return versions.get(mesh.session_uid, 0)
+
+
+def register():
+    bpy.app.handlers.depsgraph_update_post.append(on_depsgraph_update)
+    bpy.app.handlers.load_post.append(on_load)
+    bpy.app.handlers.undo_post.append(on_undo)
+    bpy.app.handlers.redo_post.append(on_undo)
+
+
+def unregister():
+    bpy.app.handlers.depsgraph_update_post.remove(on_depsgraph_update)
+    bpy.app.handlers.load_post.remove(on_load)
+    bpy.app.handlers.undo_post.remove(on_undo)
+    bpy.app.handlers.redo_post.remove(on_undo)
+    clear()
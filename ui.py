@@ -11,6 +11,7 @@ if current_dir not in sys.path:
     sys.path.append(current_dir)
 
 import operators
+import profiling
 
 class SimplePanel(bpy.types.Panel):
     bl_label = "ChopChop Addon"
@@ -23,11 +24,22 @@ class SimplePanel(bpy.types.Panel):
     def draw(self, context):
         #TODO: Change UI settings, shading type to "object" mode so the colors will show in the 3d viwer
         layout = self.layout
+        wm = context.window_manager
+        if wm.chopchop_job:
+            # A long operator is running, show how far it got
+            row = layout.row()
+            row.label(text=f"{wm.chopchop_job}... {wm.chopchop_eta}")
+            row = layout.row()
+            row.prop(wm, "chopchop_progress", slider=True)
+            row = layout.row()
+            row.label(text="Press Esc to cancel")
         row = layout.row()
         row.label(text="Import an object to chop")
         row = layout.row()
         row.prop(context.scene.mesh_importer_tool, "import_object")
         row = layout.row()
+        row.prop(context.scene.mesh_importer_tool, "optimize_orientation")
+        row = layout.row()
         row.label(text="Select an object to chop")
         row = layout.row()
         row.prop(context.scene.mesh_selector_tool, "selected_object")
@@ -37,6 +49,10 @@ class SimplePanel(bpy.types.Panel):
         row.prop(context.scene, "model_height", text="")
         row.label(text="cm")
         row = layout.row()
+        row.prop(context.scene, "use_cut_proxy")
+        if context.scene.use_cut_proxy:
+            row.prop(context.scene, "cut_proxy_faces")
+        row = layout.row()
         row.operator("object.set_drawing")
         row = layout.row()
         row.label(text="Thickness of the cut border:")
@@ -46,12 +62,19 @@ class SimplePanel(bpy.types.Panel):
         row = layout.row()
         row.operator("object.chop_obj")
         row = layout.row()
+        row.prop(context.scene, "chopit_merge_cutters")
+        row = layout.row()
         row.operator("object.chopit")
         row = layout.row()
         row.label(text="Select a folder to export")
         row = layout.row()
         row.prop(context.scene.folder_selector_tool, "export_folder")
         row = layout.row()
+        row.label(text="Export format:")
+        row.prop(context.scene.folder_selector_tool, "export_format")
+        row = layout.row()
+        row.prop(context.scene.folder_selector_tool, "skip_unchanged")
+        row = layout.row()
         row.operator("object.export_all_meshes")
         row = layout.row()
         row.label(text="Thickness of the model:")
@@ -59,6 +82,9 @@ class SimplePanel(bpy.types.Panel):
         row.prop(context.scene, "shell_thickness")
         row.label(text="cm")
         row = layout.row()
+        row.label(text="Hollowing engine:")
+        row.prop(context.scene, "hollow_engine")
+        row = layout.row()
         row.operator("object.make_hollow")
         row = layout.row()
         row.label(text="Smalles dimension of the Printer:")
@@ -66,16 +92,64 @@ class SimplePanel(bpy.types.Panel):
         row.prop(context.scene, "min_printer_dim")
         row.label(text="cm")
         row = layout.row()
+        row.label(text="Cutting engine:")
+        row = layout.row()
+        row.prop(context.scene, "cubit_engine")
+        if context.scene.cubit_engine == 'FIT':
+            row = layout.row()
+            row.label(text="Build volume of the printer:")
+            row = layout.row()
+            row.prop(context.scene, "printer_x")
+            row.prop(context.scene, "printer_y")
+            row.prop(context.scene, "printer_z")
+            row.label(text="cm")
+        if context.scene.cubit_engine == 'BOOLEAN':
+            row = layout.row()
+            row.prop(context.scene, "cubit_batch_booleans")
+        row = layout.row()
+        row.label(text="Worker processes:")
+        row.prop(context.scene, "cubit_workers")
+        row = layout.row()
         row.operator("object.cubit")
 
       
 
+class ProfilingPanel(bpy.types.Panel):
+    bl_label = "Profiling"
+    bl_idname = "OBJECT_PT_chopchop_profiling"
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = 'ChopChop'
+    bl_parent_id = "OBJECT_PT_simple_panel"
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        layout = self.layout
+        row = layout.row()
+        row.prop(context.scene, "chopchop_profiling")
+        row = layout.row()
+        row.label(text="Save profiles to:")
+        row = layout.row()
+        row.prop(context.scene, "chopchop_profile_file")
+
+        if profiling.last_report:
+            operator, total_time, stages = profiling.last_report
+            row = layout.row()
+            row.label(text=f"{operator}: {total_time:.2f} s")
+            for name, calls, seconds, allocated in stages:
+                row = layout.row()
+                row.label(text=name)
+                row.label(text=f"{seconds:.2f} s  {calls}x  {allocated / 2**20:+.1f} MB Python")
+
+
 def register():
 
     bpy.utils.register_class(SimplePanel)
+    bpy.utils.register_class(ProfilingPanel)
     
 
 def unregister():
 
+    bpy.utils.unregister_class(ProfilingPanel)
     bpy.utils.unregister_class(SimplePanel)
 